@@ -0,0 +1,121 @@
+"""
+Broadcast global chat to 2,000 sockets of which a few are slow or stalled,
+once with the old awaited send per socket and once through the per-connection
+outboxes in routes/outbox.py, and report how long the sender is held up.
+
+Needs the app dependencies installed. Run from the repository root:
+    python benchmarks/bench_backpressure.py
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")  # never contacted
+
+from routes import chat
+from routes.outbox import Outbox, evict_socket
+from routes.sessions import ChatSession
+
+CONNECTIONS = 2000
+SLOW = 20  # each send takes SLOW_SEND_S, e.g. a phone on a poor mobile link
+SLOW_SEND_S = 0.05
+STALLED = 2  # never finish a send, e.g. a backgrounded tab
+MESSAGES = 200
+RATE = 50  # messages per second
+# small limits so the run shows both policies: slow clients drop their oldest
+# frames, stalled ones go over the lag threshold and are disconnected
+MAX_FRAMES = 16
+MAX_LAG_S = 2.0
+
+
+class FakeSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = 0
+        self.closed = False
+
+    async def send_text(self, data):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def send_json(self, data):
+        await self.send_text(data)
+
+    async def close(self):
+        self.closed = True
+
+
+def connect_all():
+    chat.active_connected_users.clear()
+    chat.chat_global.clear()
+    delays = [3600.0] * STALLED + [SLOW_SEND_S] * SLOW + [0.0] * (CONNECTIONS - SLOW - STALLED)
+    sessions = []
+    for i, delay in enumerate(delays):
+        websocket = FakeSocket(delay)
+        session = chat.active_connected_users.add(ChatSession(f"user{i}", websocket))
+        session.outbox = Outbox(
+            websocket.send_text, "chat", on_evict=evict_socket(websocket, chat.disconnect_chat_user),
+            max_frames=MAX_FRAMES, max_lag=MAX_LAG_S
+        )
+        chat.set_global_membership(session, True)
+        sessions.append(session)
+    return sessions
+
+
+def message(i):
+    return {"messageType": "global", "message": {"username": "sender", "text": f"message {i}", "isOwn": False}}
+
+
+async def old_deliver(new_message):
+    # the previous implementation: every send awaited in turn
+    for session in chat.active_connected_users:
+        if new_message["message"]["username"] != session.username:
+            await session.websocket.send_json(new_message)
+
+
+async def main():
+    print(f"{CONNECTIONS} sockets, {SLOW} taking {SLOW_SEND_S * 1000:.0f} ms per send, {STALLED} stalled")
+
+    sessions = connect_all()
+    # the stalled sockets would hang this forever, so they are left out here
+    for session in sessions[:STALLED]:
+        chat.active_connected_users.remove(session.websocket)
+    start = time.perf_counter()
+    for i in range(5):
+        await old_deliver(message(i))
+    old_ms = (time.perf_counter() - start) * 1000 / 5
+    print(f"awaited sends      {old_ms:8.2f} ms per broadcast (without the stalled sockets)")
+    print(f"                   at most {1000 / old_ms:.1f} messages/s before chat falls behind for everyone")
+
+    sessions = connect_all()
+    fast = sessions[-1].websocket
+    held = 0.0
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        started = time.perf_counter()
+        chat.deliver_chat_update(message(i))
+        held += time.perf_counter() - started
+        await asyncio.sleep(1 / RATE)
+    await asyncio.sleep(MAX_LAG_S)
+    chat.deliver_chat_update(message(MESSAGES))  # stalled sockets are noticed on their next message
+    await asyncio.sleep(0.5)
+    stats = (await chat.get_active_users_stats())["queues"]
+    print(f"queued sends       {held * 1000 / MESSAGES:8.2f} ms per broadcast")
+    print(f"                   a fast client got {fast.received}/{MESSAGES + 1} messages"
+          f" after {time.perf_counter() - start:.1f} s of chat at {RATE}/s")
+    slow = sessions[STALLED].websocket
+    print(f"                   a slow client got {slow.received}/{MESSAGES + 1},"
+          f" {stats['dropped_frames']} frames dropped in total")
+    print(f"                   {sum(session.websocket.closed for session in sessions)} clients evicted,"
+          f" {len(chat.active_connected_users)} still connected")
+    print(f"queue stats        {stats}")
+    for session in chat.active_connected_users:
+        session.outbox.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
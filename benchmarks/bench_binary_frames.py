@@ -0,0 +1,106 @@
+"""
+Compare the JSON WebSocket frames with the binary ones from routes/binaryframes.py:
+size on the wire, size after permessage-deflate, and encode throughput.
+
+Run from the repository root:
+    python benchmarks/bench_binary_frames.py
+"""
+import json
+import random
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.binaryframes import (
+    INCIDENT_TYPES, decode_incident_message, decode_location_peers, encode_incident_message, encode_location_peers
+)
+
+PEERS = 100  # peers in one location frame, a busy area of interest
+INCIDENTS = 2000  # incidents in one snapshot
+DELTA_INCIDENTS = 20
+REPEATS = 500
+PLACES = ["Jalan Tun Razak, Kuala Lumpur", "Federal Highway, Petaling Jaya", "Jalan Ampang, Kuala Lumpur",
+          "Lebuhraya Damansara-Puchong, Subang Jaya", "Jalan Klang Lama, Kuala Lumpur"]
+
+
+def deflated(payload):
+    # permessage-deflate is raw deflate with the trailing 4 bytes dropped, one frame per context
+    compressor = zlib.compressobj(wbits=-15)
+    return len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def location_frames():
+    peers = [
+        {
+            "id": i,
+            "icon": f"https://roadpulse-backend.onrender.com/static/avatars/{uuid4().hex}.png",
+            "lat": random.uniform(3.0, 3.3),
+            "lng": random.uniform(101.5, 101.8)
+        }
+        for i in range(PEERS)
+    ]
+    message = {"type": "peers", "updated": peers, "removed": []}
+    records = [(i, peer["lat"], peer["lng"]) for i, peer in enumerate(peers)]
+    return message, records
+
+
+def make_incident(now):
+    return {
+        "incident_id": uuid4().hex[:24],
+        "type": random.choice(INCIDENT_TYPES),
+        "location": [random.uniform(3.0, 3.3), random.uniform(101.5, 101.8)],
+        "reported_at": (now - timedelta(minutes=random.randint(0, 600))).isoformat() + "Z",
+        "place_name": random.choice(PLACES),
+        "delay_minutes": random.choice([0, 3, 5, 7, 10, 15])
+    }
+
+
+def timed(encode, message):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        payload = encode(message)
+    return payload, (time.perf_counter() - start) * 1e6 / REPEATS
+
+
+def report(label, message, encode_binary):
+    as_json, json_us = timed(lambda m: json.dumps(m).encode(), message)
+    as_binary, binary_us = timed(encode_binary, message)
+    print(f"{label:<22} json {len(as_json):8} B {deflated(as_json):8} B deflated {json_us:9.1f} us"
+          f" | binary {len(as_binary):8} B {deflated(as_binary):8} B deflated {binary_us:9.1f} us")
+    return as_binary
+
+
+def main():
+    random.seed(5)
+    now = datetime.utcnow()
+
+    message, records = location_frames()
+    frame = report(f"location, {PEERS} peers", message, lambda m: encode_location_peers(records, []))
+    updated, removed = decode_location_peers(frame)
+    assert [index for index, lat, lng in updated] == list(range(PEERS))
+    dictionary = json.dumps({"type": "peer_dict", "peers": [
+        {"index": peer["id"], "icon": peer["icon"]} for peer in message["updated"]
+    ]})
+    print(f"{'':<22} the binary peer dictionary ({len(dictionary)} B) is sent once per peer, not every tick")
+
+    snapshot = {"type": "snapshot", "version": 42, "incidents": [make_incident(now) for _ in range(INCIDENTS)]}
+    frame = report(f"snapshot, {INCIDENTS} incidents", snapshot, encode_incident_message)
+    assert len(decode_incident_message(frame)["incidents"]) == INCIDENTS
+
+    delta = {
+        "type": "delta", "version": 43, "since": 42,
+        "added": [make_incident(now) for _ in range(DELTA_INCIDENTS)],
+        "updated": [make_incident(now) for _ in range(DELTA_INCIDENTS)],
+        "removed": [uuid4().hex[:24] for _ in range(DELTA_INCIDENTS)]
+    }
+    frame = report(f"delta, {DELTA_INCIDENTS * 3} changes", delta, encode_incident_message)
+    assert decode_incident_message(frame)["removed"] == delta["removed"]
+
+
+if __name__ == "__main__":
+    main()
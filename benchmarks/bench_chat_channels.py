@@ -0,0 +1,99 @@
+"""
+Compare the work one chat message costs on the global channel, which every
+online user is in, with a regional channel keyed by the geohash of the
+sender's live location (routes/chat.py).
+
+Needs the app dependencies installed. Run from the repository root:
+    python benchmarks/bench_chat_channels.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")  # never contacted
+
+from routes import chat
+from routes.geohash import encode_geohash
+from routes.outbox import Outbox
+from routes.sessions import ChatSession
+from config import CHAT_REGION_PRECISION
+
+USERS = (2_000, 20_000)
+MESSAGES = 200
+# most users in the Klang Valley, the rest anywhere in Peninsular Malaysia
+KLANG_VALLEY = ((2.85, 3.40), (101.40, 101.95))
+PENINSULA = ((1.30, 6.70), (100.10, 104.30))
+
+
+class FakeSocket:
+    def __init__(self):
+        self.received = 0
+
+    async def send_text(self, data):
+        self.received += 1
+
+
+def connect_all(count):
+    for session in chat.active_connected_users:
+        session.outbox.close()
+    chat.active_connected_users.clear()
+    chat.chat_global.clear()
+    chat.chat_regions.clear()
+    sessions = []
+    for i in range(count):
+        websocket = FakeSocket()
+        session = chat.active_connected_users.add(ChatSession(f"user{i}", websocket))
+        session.outbox = Outbox(websocket.send_text, "chat")
+        chat.set_global_membership(session, True)
+        (lat_range, lng_range) = KLANG_VALLEY if random.random() < 0.6 else PENINSULA
+        chat.set_chat_region(session, encode_geohash(random.uniform(*lat_range), random.uniform(*lng_range), CHAT_REGION_PRECISION))
+        sessions.append(session)
+    return sessions
+
+
+async def settle(sessions):
+    busy = [session.outbox for session in sessions if session.outbox.ready.is_set()]
+    while busy:
+        await asyncio.sleep(0)
+        busy = [outbox for outbox in busy if outbox.ready.is_set()]
+
+
+async def run(label, deliver, sessions, make_message):
+    await settle(sessions)
+    before = sum(session.websocket.received for session in sessions)
+    senders = random.sample(sessions, MESSAGES)
+    start = time.perf_counter()
+    for sender in senders:
+        deliver(make_message(sender))
+        await settle(sessions)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / MESSAGES
+    frames = (sum(session.websocket.received for session in sessions) - before) / MESSAGES
+    print(f"{label:<10} {elapsed_ms:8.2f} ms/message {frames:10,.0f} frames/message")
+
+
+def message(sender, region=None):
+    new_message = {"type": "chat_message", "messageType": "global",
+                   "message": {"username": sender.username, "text": "jam at the toll", "isOwn": False}}
+    if region:
+        new_message["messageType"] = "region"
+        new_message["region"] = region
+    return new_message
+
+
+async def main():
+    random.seed(13)
+    for count in USERS:
+        sessions = connect_all(count)
+        sizes = sorted(map(len, chat.chat_regions.values()))
+        print(f"{count} users in {len(sizes)} regions of {CHAT_REGION_PRECISION} geohash characters,"
+              f" median {sizes[len(sizes) // 2]}, largest {sizes[-1]} users")
+        await run("global", chat.deliver_chat_update, sessions, message)
+        await run("region", chat.deliver_region_update, sessions, lambda sender: message(sender, sender.region))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
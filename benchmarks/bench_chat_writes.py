@@ -0,0 +1,102 @@
+"""
+Compare one insert_one per chat message with the WriteBehindBuffer in
+routes/writebehind.py. No database is needed: the collection below charges
+a network round trip per call and, like motor's default pool, allows 100
+calls in flight. Server time per document is left out, which flatters insert_one.
+
+Run from the repository root:
+    python benchmarks/bench_chat_writes.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.writebehind import WriteBehindBuffer, WriteBufferFull
+
+ROUND_TRIP_S = 0.002
+POOL_SIZE = 100
+SENDERS = 500
+MESSAGES_PER_SENDER = 20
+
+
+class SimulatedCollection:
+    def __init__(self):
+        self.pool = asyncio.Semaphore(POOL_SIZE)
+        self.documents = 0
+        self.calls = 0
+
+    async def _write(self, count):
+        async with self.pool:
+            await asyncio.sleep(ROUND_TRIP_S)
+        self.documents += count
+        self.calls += 1
+
+    async def insert_one(self, document):
+        await self._write(1)
+
+    async def insert_many(self, documents, ordered=True):
+        await self._write(len(documents))
+
+
+def message(sender, i):
+    return {"username": f"user{sender}", "message": f"message {i}"}
+
+
+async def run(label, send, collection, finish=None):
+    latencies = []
+
+    async def sender(index):
+        for i in range(MESSAGES_PER_SENDER):
+            started = time.perf_counter()
+            await send(message(index, i))
+            latencies.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(index) for index in range(SENDERS)))
+    if finish is not None:
+        await finish()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    total = SENDERS * MESSAGES_PER_SENDER
+    print(f"{label:<16} {total / elapsed:10,.0f} msg/s {latencies[len(latencies) // 2] * 1000:8.2f} ms p50"
+          f" {latencies[int(len(latencies) * 0.99)] * 1000:8.2f} ms p99 {collection.calls:8} database calls")
+
+
+async def main():
+    print(f"{SENDERS} concurrent senders, {ROUND_TRIP_S * 1000:.0f} ms round trip")
+    collection = SimulatedCollection()
+    await run("insert_one", collection.insert_one, collection)
+
+    collection = SimulatedCollection()
+    writer = WriteBehindBuffer(collection, batch_size=100, interval=0.1)
+    writer.start()
+
+    async def send(document):
+        writer.add(document)
+        await asyncio.sleep(0)  # the request handler returning
+
+    await run("write-behind", send, collection, finish=writer.close)
+    assert collection.documents == SENDERS * MESSAGES_PER_SENDER
+    print(f"{'':<16} {writer.stats()}")
+
+    # a database that has stopped answering: the queue fills and then refuses writes
+    stalled = SimulatedCollection()
+    stalled.insert_many = lambda documents, ordered=True: asyncio.sleep(3600)
+    writer = WriteBehindBuffer(stalled, batch_size=100, interval=0.01, max_pending=1000)
+    writer.start()
+    accepted = refused = 0
+    for i in range(5000):
+        try:
+            writer.add(message(0, i))
+            accepted += 1
+        except WriteBufferFull:
+            refused += 1
+    print(f"database stalled: {accepted} accepted, {refused} refused with an overload error")
+    writer.task.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
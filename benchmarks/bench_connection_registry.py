@@ -0,0 +1,70 @@
+"""
+Compare private message routing and disconnect cleanup on the old list of
+(username, websocket) tuples with the ConnectionRegistry in routes/sessions.py.
+
+Run from the repository root:
+    python benchmarks/bench_connection_registry.py
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.sessions import ChatSession, ConnectionRegistry, LocationSession
+
+SIZES = (1_000, 10_000, 100_000)
+LOOKUPS = 2_000
+
+
+def old_lookup(users, receiver):
+    for connection in users:
+        if receiver == connection[0]:
+            return connection[1]
+
+
+def old_disconnect(users, websocket):
+    for connection in users:
+        if connection[1] == websocket:
+            users.remove(connection)
+            break
+
+
+def timed_us(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) * 1e6 / len(args)
+
+
+def main():
+    random.seed(7)
+    print(f"{'online':>8} {'list lookup':>12} {'registry':>10} {'list remove':>12} {'registry':>10}")
+    for size in SIZES:
+        sockets = [object() for _ in range(size)]
+        users = [(f"user{i}", socket) for i, socket in enumerate(sockets)]
+        registry = ConnectionRegistry()
+        for i, socket in enumerate(sockets):
+            registry.add(ChatSession(f"user{i}", socket))
+
+        receivers = [f"user{random.randrange(size)}" for _ in range(LOOKUPS)]
+        leaving = random.sample(sockets, LOOKUPS // 10)
+        print(
+            f"{size:>8} {timed_us(lambda name: old_lookup(users, name), receivers):10.2f}us"
+            f" {timed_us(registry.first, receivers):8.2f}us"
+            f" {timed_us(lambda socket: old_disconnect(users, socket), leaving):10.2f}us"
+            f" {timed_us(registry.remove, leaving):8.2f}us"
+        )
+
+    chat = ConnectionRegistry()
+    live = ConnectionRegistry()
+    for i in range(10_000):
+        chat.add(ChatSession(f"user{i}", object()))
+        live.add(LocationSession(f"user{i}", object(), f"https://example.com/static/avatars/user{i}.png"))
+    print(f"chat: {chat.stats()['bytes_per_connection']} bytes per connection,"
+          f" location: {live.stats()['bytes_per_connection']} bytes per connection")
+
+
+if __name__ == "__main__":
+    main()
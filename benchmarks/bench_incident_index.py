@@ -0,0 +1,67 @@
+"""
+Compare the old full scan in check_nearby_incidents against the SpatialGrid index.
+
+Run from the repository root:
+    python benchmarks/bench_incident_index.py
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.calculatedistance import calculate_distance
+from routes.spatialgrid import SpatialGrid
+
+RADIUS_M = 10000
+QUERIES = 200
+# roughly the bounding box of Malaysia
+LAT_RANGE = (1.0, 7.0)
+LNG_RANGE = (100.0, 119.0)
+
+
+def make_incidents(count):
+    return [
+        {
+            "incident_id": str(i),
+            "lat": random.uniform(*LAT_RANGE),
+            "lng": random.uniform(*LNG_RANGE),
+            "delay_minutes": 5,
+        }
+        for i in range(count)
+    ]
+
+
+def full_scan(incidents, lat, lng):
+    return [
+        (incident, distance)
+        for incident in incidents
+        for distance in (calculate_distance(lat, lng, incident["lat"], incident["lng"]),)
+        if distance <= RADIUS_M
+    ]
+
+
+def run(count):
+    incidents = make_incidents(count)
+    grid = SpatialGrid(cell_size_deg=0.1)
+    for incident in incidents:
+        grid.add(incident["incident_id"], incident["lat"], incident["lng"], incident)
+    points = [(random.uniform(*LAT_RANGE), random.uniform(*LNG_RANGE)) for _ in range(QUERIES)]
+
+    start = time.perf_counter()
+    scan_hits = sum(len(full_scan(incidents, lat, lng)) for lat, lng in points)
+    scan_ms = (time.perf_counter() - start) * 1000 / QUERIES
+
+    start = time.perf_counter()
+    grid_hits = sum(len(grid.query_radius(lat, lng, RADIUS_M)) for lat, lng in points)
+    grid_ms = (time.perf_counter() - start) * 1000 / QUERIES
+
+    assert scan_hits == grid_hits, (scan_hits, grid_hits)
+    print(f"{count:>7} incidents | full scan {scan_ms:9.3f} ms/query | grid {grid_ms:7.3f} ms/query | {scan_ms / grid_ms:6.1f}x")
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    for count in (10_000, 100_000):
+        run(count)
@@ -0,0 +1,184 @@
+"""
+Simulate 5,000 live location connections and compare the old broadcast-to-everyone
+fan-out with the grid based area of interest and tick batching in routes/location.py.
+
+Needs the app dependencies installed. Run from the repository root:
+    python benchmarks/bench_location_aoi.py
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")  # never contacted
+
+from routes import location
+from routes.outbox import Outbox
+from routes.sessions import LocationSession
+
+CONNECTIONS = 5000
+UPDATES = 50
+# the Klang Valley, roughly 60 x 60 km
+LAT_RANGE = (2.85, 3.40)
+LNG_RANGE = (101.40, 101.95)
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_json(self, data):
+        # frames are encoded like the real socket would, so egress is comparable
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def send_text(self, text):
+        self.frames += 1
+        self.bytes += len(text)
+
+
+def connect(name):
+    session = LocationSession(name, FakeSocket(), f"https://example.com/static/avatars/{name}.png")
+    session.outbox = Outbox(
+        lambda frame, session=session: location.send_location_frame(session, frame), "location",
+        policy="latest", merge=location.merge_location_frames
+    )
+    return location.location_users.add(session)
+
+
+async def tick(sessions):
+    # the tick only queues frames; wait for every writer to send them
+    await location.location_tick()
+    busy = [session.outbox for session in sessions if session.outbox.ready.is_set()]
+    while busy:
+        await asyncio.sleep(0)
+        busy = [outbox for outbox in busy if outbox.ready.is_set()]
+
+
+def connect_all():
+    for session in location.location_users:
+        session.outbox.close()
+    location.location_users.clear()
+    location.location_grid.clear()
+    location.location_dirty.clear()
+    location.location_departed.clear()
+    sessions = [connect(f"Guest{i}") for i in range(CONNECTIONS)]
+    # everybody reports a first position, which is not timed
+    for session in sessions:
+        session.lat = random.uniform(*LAT_RANGE)
+        session.lng = random.uniform(*LNG_RANGE)
+        location.location_grid.add(session.websocket, session.lat, session.lng, session)
+        location.location_dirty.add(session.websocket)
+    return sessions
+
+
+def drive(session):
+    # a small move from the device's current position, like a car between GPS fixes
+    return {
+        "location": {"lat": session.lat + random.uniform(-0.0005, 0.0005), "lng": session.lng + random.uniform(-0.0005, 0.0005)},
+    }
+
+
+def random_update():
+    return {
+        "location": {"lat": random.uniform(*LAT_RANGE), "lng": random.uniform(*LNG_RANGE)},
+    }
+
+
+async def old_broadcast(sender, new_message):
+    # the previous implementation, kept here for comparison
+    username = sender.username
+    location_data = new_message["location"]
+    users = list(location.location_users)
+    for session in users:
+        if username == session.username:
+            session.lat = location_data["lat"]
+            session.lng = location_data["lng"]
+    all_users_data = [{"icon": user.icon, "lat": user.lat, "lng": user.lng} for user in users]
+    for session in users:
+        return_list = [data for i, data in enumerate(all_users_data) if users[i].username != session.username]
+        await session.websocket.send_json(return_list)
+
+
+async def run(label, broadcast, updates):
+    sessions = connect_all()
+    sockets = [session.websocket for session in sessions]
+    await tick(sessions)
+    for socket in sockets:
+        socket.frames = socket.bytes = 0
+
+    start = time.perf_counter()
+    for i in range(updates):
+        sender = random.choice(sessions)
+        await broadcast(sender, random_update())
+    elapsed_ms = (time.perf_counter() - start) * 1000 / updates
+    frames = sum(socket.frames for socket in sockets) / updates
+    egress_kb = sum(socket.bytes for socket in sockets) / updates / 1024
+    print(f"{label:<24} {elapsed_ms:10.2f} ms/update {frames:8.0f} frames/update {egress_kb:12.1f} KiB/update")
+
+
+async def update_and_tick(sender, new_message):
+    await location.broadcast_location_update(sender, new_message)
+    await tick(location.location_users)
+
+
+async def watch_stalls(stalls):
+    # the longest the event loop went without running this task, i.e. how long the tick blocked other sockets
+    loop = asyncio.get_running_loop()
+    last = loop.time()
+    while True:
+        await asyncio.sleep(0)
+        now = loop.time()
+        stalls.append(now - last)
+        last = now
+
+
+async def run_tick(label, devices, updates_per_device, ticks):
+    sessions = connect_all()
+    sockets = [session.websocket for session in sessions]
+    await tick(sessions)
+    for socket in sockets:
+        socket.frames = socket.bytes = 0
+
+    chatty = random.sample(sessions, devices)
+    tick_ms = []
+    stalls = []
+    for _ in range(ticks):
+        for _ in range(updates_per_device):
+            for session in chatty:
+                await location.broadcast_location_update(session, drive(session))
+        # only the tick is timed, the updates arrive between ticks in the app
+        watcher = asyncio.ensure_future(watch_stalls(stalls))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await tick(sessions)
+        tick_ms.append((time.perf_counter() - start) * 1000)
+        watcher.cancel()
+    elapsed_ms = sum(tick_ms) / ticks
+    interval_ms = 1000 / location.LOCATION_TICK_HZ
+    frames = sum(socket.frames for socket in sockets) / ticks
+    egress_kb = sum(socket.bytes for socket in sockets) / ticks / 1024
+    print(f"{label:<24} {elapsed_ms:10.2f} ms/tick   {frames:8.0f} frames/tick   {egress_kb:12.1f} KiB/tick")
+    fits = "fits" if max(tick_ms) <= interval_ms else "does NOT fit"
+    print(f"{'':<24} slowest tick {max(tick_ms):.2f} ms {fits} the {interval_ms:.0f} ms interval at LOCATION_TICK_HZ={location.LOCATION_TICK_HZ:g}, "
+          f"longest event loop stall {max(stalls) * 1000:.2f} ms")
+    print(f"{'':<24} {location.location_users.stats()['bytes_per_connection']} bytes per connection in the registry")
+
+
+async def main():
+    random.seed(3)
+    print(f"{CONNECTIONS} connections, AOI radius {location.LOCATION_AOI_RADIUS_M} m")
+    # the old fan-out takes about a minute per update at this size
+    await run("broadcast to everyone", old_broadcast, 1)
+    await run("AOI, tick per update", update_and_tick, UPDATES)
+    # 1,000 moving devices reporting once or ten times per tick cost about the same
+    await run_tick("tick, 1 update/device", 1000, 1, 5)
+    await run_tick("tick, 10 updates/device", 1000, 10, 5)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
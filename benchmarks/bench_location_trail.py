@@ -0,0 +1,68 @@
+"""
+Memory and speed of keeping every user's recent positions: a list of dicts
+per user against the LocationTrail ring buffer in routes/trail.py, for
+users reporting at 1 Hz for an hour.
+
+Run from the repository root:
+    python benchmarks/bench_location_trail.py
+"""
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.trail import LocationTrail
+
+USERS = 1_000
+SECONDS = 3_600
+CAPACITY = 900  # LOCATION_TRAIL_POINTS default
+
+
+def drive(trails, record):
+    random.seed(5)
+    positions = [[random.uniform(2.85, 3.40), random.uniform(101.40, 101.95)] for _ in range(USERS)]
+    start = time.perf_counter()
+    for second in range(SECONDS):
+        for user, position in enumerate(positions):
+            position[0] += random.uniform(-0.0001, 0.0001)
+            position[1] += random.uniform(-0.0001, 0.0001)
+            record(trails[user], second, position[0], position[1])
+    return (time.perf_counter() - start) * 1e9 / (USERS * SECONDS)
+
+
+def measure(label, make, record, downsample):
+    tracemalloc.start()
+    trails = [make() for _ in range(USERS)]
+    ns = drive(trails, record)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for trail in trails[:100]:
+        downsample(trail)
+    trail_ms = (time.perf_counter() - start) * 1000 / 100
+    print(f"{label:<26} {size / USERS / 1024:10.1f} KiB/user {ns:8.0f} ns/update {trail_ms:8.3f} ms/trail request")
+
+
+def list_record(trail, timestamp, lat, lng):
+    trail.append({"time": timestamp, "lat": lat, "lng": lng})
+
+
+def list_downsample(trail):
+    points = [point for point in trail if point["time"] >= SECONDS - 600]
+    step = max(1, len(points) // 100)
+    return points[::step]
+
+
+def main():
+    print(f"{USERS} users reporting at 1 Hz for {SECONDS} s")
+    measure("list of dicts, unbounded", list, list_record, list_downsample)
+    measure(f"LocationTrail({CAPACITY})", lambda: LocationTrail(CAPACITY),
+            lambda trail, timestamp, lat, lng: trail.append(timestamp, lat, lng),
+            lambda trail: trail.downsample(SECONDS - 600, 100))
+
+
+if __name__ == "__main__":
+    main()
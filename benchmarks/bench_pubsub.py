@@ -0,0 +1,113 @@
+"""
+Measure cross-worker broadcast latency and throughput of the Redis broadcast
+backend in routes/pubsub.py. No Redis is needed: a minimal stand-in server
+speaking the same protocol (SUBSCRIBE, PUBLISH, INCR) runs in-process.
+Point REDIS_URL at a real server to measure that instead.
+
+Run from the repository root:
+    python benchmarks/bench_pubsub.py
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.pubsub import RedisBackend, encode_command, read_reply
+
+WORKERS = 4
+MESSAGES = 5000
+
+
+class StandInRedis:
+    """
+    Just enough of a Redis server for pub/sub between workers.
+    """
+
+    def __init__(self):
+        self.subscribers = {}  # channel -> set of writers
+        self.counters = {}
+
+    async def handle(self, reader, writer):
+        channels = []
+        try:
+            while True:
+                command = await read_reply(reader)
+                name = command[0].upper()
+                if name == b"SUBSCRIBE":
+                    for count, channel in enumerate(command[1:], 1):
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        channels.append(channel)
+                        writer.write(b"*3\r\n$9\r\nsubscribe\r\n" + encode_command(channel)[4:] + b":%d\r\n" % count)
+                elif name == b"PUBLISH":
+                    receivers = self.subscribers.get(command[1], ())
+                    message = b"*3\r\n$7\r\nmessage\r\n" + encode_command(command[1], command[2])[4:]
+                    for receiver in receivers:
+                        receiver.write(message)
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif name == b"INCR":
+                    self.counters[command[1]] = self.counters.get(command[1], 0) + 1
+                    writer.write(b":%d\r\n" % self.counters[command[1]])
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            for channel in channels:
+                self.subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+
+async def main():
+    url = os.getenv("REDIS_URL")
+    server = None
+    if url is None:
+        server = await asyncio.start_server(StandInRedis().handle, "127.0.0.1", 0)
+        url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    received = [0] * WORKERS
+    latencies = []
+    done = asyncio.Event()
+
+    def handler(index):
+        async def on_message(data):
+            received[index] += 1
+            latencies.append(time.perf_counter() - data["sent"])
+            if sum(received) == MESSAGES * (WORKERS - 1):
+                done.set()
+        return on_message
+
+    workers = []
+    for index in range(WORKERS):
+        backend = RedisBackend(url)
+        backend.subscribe("bench", handler(index))
+        await backend.connect()
+        workers.append(backend)
+
+    guests = await asyncio.gather(*(worker.incr("bench_guest_index") for worker in workers))
+    assert len(set(guests)) == WORKERS, guests
+
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        await workers[0].publish("bench", {"sent": time.perf_counter(), "i": i})
+    await asyncio.wait_for(done.wait(), 60)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{WORKERS} workers over {url}")
+    print(f"{MESSAGES} broadcasts in {elapsed:.2f} s, {MESSAGES / elapsed:,.0f}/s published,"
+          f" {sum(received):,} deliveries to the other workers")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"guest numbers handed out across workers: {sorted(guests)}")
+
+    for worker in workers:
+        await worker.disconnect()
+    if server is not None:
+        server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Time the NumPy route delay engine on a 2,000 point route with 5,000 active incidents.
+
+Run from the repository root:
+    python benchmarks/bench_route_delay.py
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes.calculatedistance import calculate_distance
+from routes.routedelay import distances_to_route, route_bounding_box
+from routes.spatialgrid import SpatialGrid
+
+ROUTE_POINTS = 2000
+INCIDENTS = 5000
+THRESHOLD_M = 100
+REPEATS = 20
+
+
+def make_route():
+    # a meandering drive of roughly 200 km starting in Kuala Lumpur
+    lat, lng = 3.139, 101.6869
+    route = []
+    heading = random.uniform(0, 2 * np.pi)
+    for _ in range(ROUTE_POINTS):
+        route.append([lat, lng])
+        heading += random.uniform(-0.3, 0.3)
+        lat += 0.0009 * np.cos(heading)
+        lng += 0.0009 * np.sin(heading)
+    return route
+
+
+def make_incidents(route, count):
+    incidents = []
+    for i in range(count):
+        if i % 5 == 0:
+            # a fifth of the incidents sit right next to the route
+            lat, lng = random.choice(route)
+            lat += random.uniform(-0.002, 0.002)
+            lng += random.uniform(-0.002, 0.002)
+        else:
+            lat, lng = random.uniform(1.0, 7.0), random.uniform(100.0, 119.0)
+        incidents.append({"incident_id": str(i), "lat": lat, "lng": lng})
+    return incidents
+
+
+def old_vertex_scan(route, incidents):
+    return [
+        incident for incident in incidents
+        if min(calculate_distance(incident["lat"], incident["lng"], pt[0], pt[1]) for pt in route) <= THRESHOLD_M
+    ]
+
+
+def new_engine(route, grid):
+    candidates = grid.query_bbox(*route_bounding_box(route, THRESHOLD_M))
+    distances = distances_to_route(
+        route,
+        [incident["lat"] for incident in candidates],
+        [incident["lng"] for incident in candidates],
+        THRESHOLD_M,
+    )
+    return [incident for incident, distance in zip(candidates, distances) if distance <= THRESHOLD_M]
+
+
+def brute_force_segments(route, incidents):
+    # dense resampling of every segment as an independent reference
+    hits = set()
+    for incident in incidents:
+        for (a_lat, a_lng), (b_lat, b_lng) in zip(route, route[1:]):
+            if any(
+                calculate_distance(incident["lat"], incident["lng"], a_lat + (b_lat - a_lat) * t, a_lng + (b_lng - a_lng) * t) <= THRESHOLD_M - 0.5
+                for t in np.linspace(0, 1, 50)
+            ):
+                hits.add(incident["incident_id"])
+                break
+    return hits
+
+
+if __name__ == "__main__":
+    random.seed(7)
+    route = make_route()
+    incidents = make_incidents(route, INCIDENTS)
+    grid = SpatialGrid(cell_size_deg=0.1)
+    for incident in incidents:
+        grid.add(incident["incident_id"], incident["lat"], incident["lng"], incident)
+
+    new_engine(route, grid)  # warm up
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        new_hits = new_engine(route, grid)
+    new_ms = (time.perf_counter() - start) * 1000 / REPEATS
+
+    sample = incidents[::25]
+    start = time.perf_counter()
+    old_hits = old_vertex_scan(route, sample)
+    old_ms = (time.perf_counter() - start) * 1000 * (len(incidents) / len(sample))
+
+    print(f"{ROUTE_POINTS} route points, {INCIDENTS} incidents")
+    print(f"  nested vertex loop  ~{old_ms:10.1f} ms (extrapolated from {len(sample)} incidents)")
+    print(f"  numpy segment engine {new_ms:10.2f} ms, {len(new_hits)} incidents within {THRESHOLD_M} m")
+
+    new_sample = {incident["incident_id"] for incident in new_engine(route, grid)} & {i["incident_id"] for i in sample}
+    old_sample = {incident["incident_id"] for incident in old_hits}
+    assert old_sample <= new_sample, "segment distance must find every vertex hit"
+    assert brute_force_segments(route, sample) <= new_sample, "missed an incident near a segment"
@@ -16,4 +16,33 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Live location sharing: peers are only sent to clients within this radius
+LOCATION_AOI_RADIUS_M = int(os.getenv("LOCATION_AOI_RADIUS_M", "5000"))
+# How many batched location frames each client receives per second at most
+LOCATION_TICK_HZ = float(os.getenv("LOCATION_TICK_HZ", "2"))
+
+# Positions kept per location session for its recent trail, 15 minutes at 1 Hz
+LOCATION_TRAIL_POINTS = int(os.getenv("LOCATION_TRAIL_POINTS", "900"))
+
+# Every WebSocket gets a bounded outbound queue; past these limits frames are dropped
+# or coalesced, and a client whose oldest queued frame is older than the lag is disconnected
+OUTBOX_MAX_FRAMES = int(os.getenv("OUTBOX_MAX_FRAMES", "64"))
+OUTBOX_MAX_LAG_S = float(os.getenv("OUTBOX_MAX_LAG_S", "10"))
+
+# Global chat messages kept in memory and sent to every chat socket as it joins
+CHAT_BACKLOG_SIZE = int(os.getenv("CHAT_BACKLOG_SIZE", "50"))
+
+# /chat/send messages are written in batches: when this many are waiting or after the interval,
+# and new messages are refused once the queue is full
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+CHAT_WRITE_INTERVAL_S = float(os.getenv("CHAT_WRITE_INTERVAL_S", "0.1"))
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000"))
+
+# Regional chat channels are the geohash cell of the user's live location, 4 characters is about 39 x 20 km
+CHAT_REGION_PRECISION = int(os.getenv("CHAT_REGION_PRECISION", "4"))
+
+# Where WebSocket broadcasts are shared between workers: "memory://" for a single
+# worker, "redis://host:6379/0" to run several workers or replicas
+BROADCAST_BACKEND_URL = os.getenv("BROADCAST_BACKEND_URL", "memory://")
+
 origins = ["*"]
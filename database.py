@@ -11,8 +11,32 @@ async def init_indexes():
 
 admin_collection = db["admin_details"]
 incident_report_collection = db["IncidentReport"]
+incident_archive_collection = db["IncidentArchive"]  # cleared incidents moved out of the hot collection
 route_collection = db["userData"]
 global_chat_collection = db["GlobalChat"]
 saved_destination = db["saved_destinations"]
 reward_collection = db["rewards"]
-reward_history_collection = db["reward_history"]
\ No newline at end of file
+reward_history_collection = db["reward_history"]
+
+async def init_incident_indexes():
+    # Backfill a GeoJSON point for incidents stored before the location field existed
+    await incident_report_collection.update_many(
+        {"location": {"$exists": False}, "lat": {"$type": "number"}, "lng": {"$type": "number"}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$lng", "$lat"]}}}]
+    )
+    await incident_report_collection.create_index(
+        [("incident_status_cleared", 1), ("incident_type", 1), ("location", "2dsphere")]
+    )
+    # Partial indexes only hold the documents the expiry sweeper looks for
+    await incident_report_collection.create_index(
+        [("expires_at", 1)],
+        partialFilterExpression={"incident_status_cleared": False}
+    )
+    await incident_report_collection.create_index(
+        [("cleared_at", 1)],
+        partialFilterExpression={"incident_status_cleared": True}
+    )
+
+async def init_chat_indexes():
+    # chat history is paged by (timestamp, _id) in both directions
+    await global_chat_collection.create_index([("timestamp", 1), ("_id", 1)])
@@ -2,8 +2,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import login, navigate, incident, userprofile, usernavreward, speedlimit, admin, chat, favdestination, user, reports, location, auth
 from config import origins
+from database import init_incident_indexes, init_chat_indexes
+from routes.httpclient import close_http_client
+from routes.pubsub import broadcast_backend
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+import asyncio
 
 
 app = FastAPI()
@@ -22,6 +26,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],  # chat history pagination
 )
 
 app.include_router(login.router)
@@ -40,6 +45,29 @@ app.include_router(location.router)
 app.include_router(auth.router)
 
 
+background_tasks = []
+
+
+@app.on_event("startup")
+async def startup():
+    await init_incident_indexes()
+    await init_chat_indexes()
+    await chat.load_recent_messages()
+    chat.chat_writer.start()
+    await broadcast_backend.connect()
+    background_tasks.append(asyncio.create_task(incident.incident_expiry_loop()))
+    background_tasks.append(asyncio.create_task(location.location_tick_loop()))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    # write the chat messages still buffered before the process goes away
+    await chat.chat_writer.close()
+    await broadcast_backend.disconnect()
+    await close_http_client()
+
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))  # Default to 10000 if PORT not set
@@ -87,6 +87,25 @@ class NearbyIncidentsResponse(BaseModel):
     count: int
     total_delay_minutes: int
 
+class IncidentCluster(BaseModel):
+    lat: float
+    lng: float
+    count: int
+    dominant_type: str
+    total_delay_minutes: int
+    incident_id: Optional[str] = None  # set when the cluster is a single incident
+
+class IncidentTile(BaseModel):
+    x: int
+    y: int
+    clusters: List[IncidentCluster]
+
+class IncidentClustersResponse(BaseModel):
+    zoom: int
+    tiles: List[IncidentTile]
+    cluster_count: int
+    incident_count: int
+
 class TrafficCard(BaseModel):
     severity: str  # "Heavy", "Medium", "Light"
     lastUpdated: str
@@ -94,6 +113,9 @@ class TrafficCard(BaseModel):
     delay: int
     distance_km: float
     delay_per_km: float
+    # "leg": Directions only reports traffic for the whole route, so severity and delay_per_km
+    # are the leg's, shared by every card, and delay is the card's share of the leg's delay
+    traffic_scope: str = "leg"
 
 class IncidentStatusUpdate(BaseModel):
     status: bool
@@ -117,6 +139,7 @@ class ChatMessage(BaseModel):
     username: str
     message: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    client_message_id: Optional[str] = Field(None, max_length=64)  # set by the sending client, the same for every copy of a message
 
 class SpeedLimitWarningRequest(BaseModel):
     lat: float
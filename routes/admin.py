@@ -7,6 +7,7 @@ from typing import Optional
 from datetime import datetime, timedelta
 import random
 from collections import defaultdict
+from .incident import sync_incident_status, status_update, count_all_incidents
 
 router = APIRouter()
 
@@ -41,8 +42,8 @@ async def get_admin_stats(current_admin: str = Depends(verify_admin_token)):
         # Count total users
         total_users = await user_collection.count_documents({})
         
-        # Count total incidents
-        total_incidents = await incident_report_collection.count_documents({})
+        # Count total incidents, including cleared ones already archived
+        total_incidents = await count_all_incidents()
         
         # Count active incidents (not cleared)
         active_incidents = await incident_report_collection.count_documents({"incident_status_cleared": False})
@@ -218,7 +219,7 @@ async def get_usage_analytics(
             "monthly_active_users": random.randint(6000, 7500),
             "peak_concurrent_users": random.randint(200, 400),
             "average_session_duration": random.randint(15, 45),  # minutes
-            "total_incidents_reported": await incident_report_collection.count_documents({}),
+            "total_incidents_reported": await count_all_incidents(),
             "total_routes_calculated": await route_collection.count_documents({}),
             "user_engagement_score": round(random.uniform(0.6, 0.9), 2),
             "system_uptime": 99.8,
@@ -307,12 +308,13 @@ async def update_incident_status(incident_id: str, status: bool, current_admin:
         from bson import ObjectId
         result = await incident_report_collection.update_one(
             {"_id": ObjectId(incident_id)},
-            {"$set": {"incident_status_cleared": status}}
+            status_update(status)
         )
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Incident not found")
-        
+
+        await sync_incident_status(incident_id, status)
         return {"message": "Incident status updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating incident: {str(e)}")
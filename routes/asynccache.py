@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+
+class TTLCache:
+    """
+    Small in-process cache whose entries expire after ttl seconds.
+    Concurrent misses for the same key share a single load, so a burst of
+    identical requests costs one upstream call.
+    """
+
+    def __init__(self, ttl, max_entries=2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}  # key -> (expires_at, value)
+        self.inflight = {}  # key -> future of the load in progress
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """
+        Return (True, value) on a fresh hit, (False, None) otherwise.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return False, None
+        return True, entry[1]
+
+    def set(self, key, value):
+        if len(self.entries) >= self.max_entries:
+            now = time.monotonic()
+            for stale in [k for k, (expires_at, _) in self.entries.items() if expires_at < now]:
+                del self.entries[stale]
+            while len(self.entries) >= self.max_entries:
+                # dicts keep insertion order, so this drops the oldest entry
+                del self.entries[next(iter(self.entries))]
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    async def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, or await loader() once for all concurrent callers.
+        Failed loads are not cached.
+        """
+        found, value = self.lookup(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, loader))
+            self.inflight[key] = future
+        # shield so one caller disconnecting does not cancel the load for the others
+        return await asyncio.shield(future)
+
+    async def _load(self, key, loader):
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            self.inflight.pop(key, None)
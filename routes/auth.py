@@ -12,6 +12,10 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 # Function to decode and verify the token
 def verify_token(token: str = Depends(oauth2_scheme)):
+    return verify_token_payload(token)["sub"]  # Return the username extracted from the token
+
+# Decode and verify the token, returning all of its claims
+def verify_token_payload(token: str):
     try:
         # Decode the token using the secret key and algorithm
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -22,7 +26,7 @@ def verify_token(token: str = Depends(oauth2_scheme)):
                 detail="Invalid token",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return username  # Return the username extracted from the token
+        return payload
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
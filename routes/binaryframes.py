@@ -0,0 +1,136 @@
+import struct
+from datetime import datetime
+from functools import lru_cache
+
+# First byte of every binary frame
+LOCATION_PEERS = 1
+INCIDENT_SNAPSHOT = 2
+INCIDENT_DELTA = 3
+
+# Incident types are sent as a one byte code, 255 for anything not in this list
+INCIDENT_TYPES = ("pothole", "accident", "breakdown", "oilspill", "roadblock", "speedcamera", "police")
+INCIDENT_TYPE_CODES = {name: code for code, name in enumerate(INCIDENT_TYPES)}
+UNKNOWN_INCIDENT_TYPE = 255
+
+PEERS_HEADER = struct.Struct("<BII")  # frame type, updated count, removed count
+PEER_RECORD = struct.Struct("<Iff")  # peer index, lat, lng
+PEER_INDEX = struct.Struct("<I")
+SNAPSHOT_HEADER = struct.Struct("<BIIB")  # frame type, version, incident count, has bbox
+BBOX = struct.Struct("<ffff")  # south, west, north, east
+DELTA_HEADER = struct.Struct("<BIIIII")  # frame type, version, since, added, updated, removed counts
+INCIDENT_RECORD = struct.Struct("<12sBffHIB")  # id, type, lat, lng, delay minutes, reported at, place name length
+INCIDENT_ID = struct.Struct("<12s")
+
+
+def encode_location_peers(updated, removed):
+    """
+    Pack a location tick frame.
+    `updated` holds (peer index, lat, lng) tuples and `removed` peer indexes.
+    Each peer costs 12 bytes; its name and avatar are sent once, separately.
+    """
+    parts = [PEERS_HEADER.pack(LOCATION_PEERS, len(updated), len(removed))]
+    parts.extend(PEER_RECORD.pack(index, lat, lng) for index, lat, lng in updated)
+    parts.extend(PEER_INDEX.pack(index) for index in removed)
+    return b"".join(parts)
+
+
+def decode_location_peers(frame):
+    frame_type, updated_count, removed_count = PEERS_HEADER.unpack_from(frame)
+    offset = PEERS_HEADER.size
+    updated = list(PEER_RECORD.iter_unpack(frame[offset:offset + updated_count * PEER_RECORD.size]))
+    offset += updated_count * PEER_RECORD.size
+    removed = [index for index, in PEER_INDEX.iter_unpack(frame[offset:offset + removed_count * PEER_INDEX.size])]
+    return updated, removed
+
+
+@lru_cache(maxsize=4096)
+def reported_at_seconds(reported_at):
+    if not reported_at:
+        return 0
+    try:
+        return int(datetime.fromisoformat(reported_at.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return 0
+
+
+def pack_incident(incident):
+    """
+    One formatted incident (see format_incident) as a packed record.
+    Place names longer than 255 bytes are cut off on a character boundary,
+    so the bytes always decode as UTF-8.
+    """
+    place_name = (incident.get("place_name") or "").encode()
+    if len(place_name) > 255:
+        place_name = place_name[:255].decode(errors="ignore").encode()
+    lat, lng = incident["location"]
+    return INCIDENT_RECORD.pack(
+        bytes.fromhex(incident["incident_id"]),
+        INCIDENT_TYPE_CODES.get(incident["type"], UNKNOWN_INCIDENT_TYPE),
+        lat,
+        lng,
+        min(int(incident.get("delay_minutes") or 0), 0xFFFF),
+        reported_at_seconds(incident.get("reported_at")),
+        len(place_name),
+    ) + place_name
+
+
+def unpack_incidents(frame, offset, count):
+    incidents = []
+    for _ in range(count):
+        incident_id, type_code, lat, lng, delay, reported_at, name_length = INCIDENT_RECORD.unpack_from(frame, offset)
+        offset += INCIDENT_RECORD.size
+        incidents.append({
+            "incident_id": incident_id.hex(),
+            "type": INCIDENT_TYPES[type_code] if type_code < len(INCIDENT_TYPES) else None,
+            "location": [lat, lng],
+            "reported_at": reported_at,
+            "place_name": bytes(frame[offset:offset + name_length]).decode(),
+            "delay_minutes": delay
+        })
+        offset += name_length
+    return incidents, offset
+
+
+def encode_incident_message(message):
+    """
+    Binary form of an incident WebSocket snapshot or delta message.
+    """
+    if message["type"] == "snapshot":
+        bbox = message.get("bbox")
+        parts = [SNAPSHOT_HEADER.pack(INCIDENT_SNAPSHOT, message["version"], len(message["incidents"]), bbox is not None)]
+        if bbox is not None:
+            parts.append(BBOX.pack(*bbox))
+        parts.extend(map(pack_incident, message["incidents"]))
+        return b"".join(parts)
+
+    parts = [DELTA_HEADER.pack(
+        INCIDENT_DELTA, message["version"], message["since"],
+        len(message["added"]), len(message["updated"]), len(message["removed"])
+    )]
+    parts.extend(map(pack_incident, message["added"]))
+    parts.extend(map(pack_incident, message["updated"]))
+    parts.extend(INCIDENT_ID.pack(bytes.fromhex(incident_id)) for incident_id in message["removed"])
+    return b"".join(parts)
+
+
+def decode_incident_message(frame):
+    """
+    Inverse of encode_incident_message, used by the benchmark and as a
+    reference for client implementations. Timestamps come back as epoch seconds.
+    """
+    if frame[0] == INCIDENT_SNAPSHOT:
+        frame_type, version, count, has_bbox = SNAPSHOT_HEADER.unpack_from(frame)
+        offset = SNAPSHOT_HEADER.size
+        message = {"type": "snapshot", "version": version}
+        if has_bbox:
+            message["bbox"] = list(BBOX.unpack_from(frame, offset))
+            offset += BBOX.size
+        message["incidents"], offset = unpack_incidents(frame, offset, count)
+        return message
+
+    frame_type, version, since, added_count, updated_count, removed_count = DELTA_HEADER.unpack_from(frame)
+    offset = DELTA_HEADER.size
+    added, offset = unpack_incidents(frame, offset, added_count)
+    updated, offset = unpack_incidents(frame, offset, updated_count)
+    removed = [incident_id.hex() for incident_id, in INCIDENT_ID.iter_unpack(frame[offset:offset + removed_count * INCIDENT_ID.size])]
+    return {"type": "delta", "version": version, "since": since, "added": added, "updated": updated, "removed": removed}
@@ -0,0 +1,85 @@
+import json
+from config import OUTBOX_MAX_FRAMES, OUTBOX_MAX_LAG_S
+from .outbox import Outbox, evict_socket, outbox_stats
+
+
+class Broadcaster:
+    """
+    Fans one pre-serialized payload out to many WebSockets. Every socket has
+    its own Outbox, so a broadcast only queues the payload and one slow phone
+    cannot hold up the other subscribers; a socket that falls too far behind
+    or fails a send is closed and dropped.
+    """
+
+    def __init__(self, channel, policy="drop_oldest", max_frames=OUTBOX_MAX_FRAMES, max_lag=OUTBOX_MAX_LAG_S):
+        self.channel = channel
+        self.policy = policy
+        self.max_frames = max_frames
+        self.max_lag = max_lag
+        self.connections = {}  # websocket -> Outbox
+        self.binary = set()  # connections that asked for binary frames
+
+    def __len__(self):
+        return len(self.connections)
+
+    def add(self, websocket, binary=False):
+        self.remove(websocket)
+        self.connections[websocket] = Outbox(
+            lambda payload: self._send(websocket, payload), self.channel, policy=self.policy,
+            on_evict=evict_socket(websocket, self.remove),
+            max_frames=self.max_frames, max_lag=self.max_lag
+        )
+        if binary:
+            self.binary.add(websocket)
+
+    def remove(self, websocket):
+        outbox = self.connections.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+        self.binary.discard(websocket)
+
+    @staticmethod
+    async def _send(websocket, payload):
+        if isinstance(payload, bytes):
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+
+    def encode(self, websocket, message, encode_binary=None):
+        if encode_binary is not None and websocket in self.binary:
+            return encode_binary(message)
+        return json.dumps(message)
+
+    def send_to(self, websocket, message, encode_binary=None):
+        """
+        Queue a message for one connection, in order with the broadcasts it receives.
+        """
+        outbox = self.connections.get(websocket)
+        if outbox is not None:
+            outbox.put(self.encode(websocket, message, encode_binary))
+
+    def send(self, message, personal=None, exclude=(), encode_binary=None):
+        """
+        Serialize the message once and queue it for every connection.
+        Connections in `personal` get their own message instead, and
+        connections in `exclude` get nothing. Binary connections get the
+        message passed through `encode_binary`, also encoded only once.
+        """
+        personal = personal or {}
+        payload = message if isinstance(message, str) else json.dumps(message)
+        binary_payload = None
+
+        for websocket, outbox in list(self.connections.items()):
+            if websocket in personal:
+                outbox.put(self.encode(websocket, personal[websocket], encode_binary))
+            elif websocket in exclude:
+                continue
+            elif encode_binary is not None and websocket in self.binary:
+                if binary_payload is None:
+                    binary_payload = encode_binary(message)
+                outbox.put(binary_payload)
+            else:
+                outbox.put(payload)
+
+    def stats(self):
+        return {"connections": len(self.connections), "queues": outbox_stats(self.channel, self.connections.values())}
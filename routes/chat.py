@@ -1,119 +1,296 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, status, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, status, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+import asyncio
 import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from bson import ObjectId
+from pymongo.errors import DocumentTooLarge
+from collections import deque
 from datetime import datetime, timedelta
 from .auth import verify_token, get_current_admin_user
 from model import ChatMessage
 from database import global_chat_collection
+from config import CHAT_BACKLOG_SIZE, CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_INTERVAL_S, CHAT_WRITE_MAX_PENDING
+from .sessions import ConnectionRegistry, ChatSession
+from .pubsub import broadcast_backend
+from .outbox import Outbox, evict_socket, outbox_stats
+from .wordfilter import WordFilter
+from .writebehind import WriteBehindBuffer, WriteBufferFull
+from .location import location_regions, region_listeners
+from .socketauth import socket_identity, session_is_current, reauthenticate, reject_expired, schedule_token_refresh, cancel_token_refresh
 import csv 
-import re
 from typing import List, Optional
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-active_connected_users = [] # this is only for user that would connect to the chat feature
-guestIndex= 0
-sensitive_words = []
+active_connected_users = ConnectionRegistry() # this is only for user that would connect to the chat feature
+# /chat/send messages are written in batches by a background task started with the app
+chat_writer = WriteBehindBuffer(
+    global_chat_collection, batch_size=CHAT_WRITE_BATCH_SIZE,
+    interval=CHAT_WRITE_INTERVAL_S, max_pending=CHAT_WRITE_MAX_PENDING
+)
 
-# Precompile the sensitive words into a single regular expression
-def compile_sensitive_words(sensitive_words):
-    # Escape special characters and join words into a regex pattern
-    pattern = r'\b(?:' + '|'.join(re.escape(word) for word in sensitive_words) + r')\b'
-    return re.compile(pattern, flags=re.IGNORECASE)
+# word lists masked out of chat, reloaded with POST /chat/filter/reload after editing them
+SENSITIVE_WORD_FILES = ['en/pornography.csv', 'en/violence.csv', 'en/vulgar.csv']
 
-# Improved filter_message function
 def filter_message(message: str) -> str:
-    if not sensitive_words:
-        return message  # No filtering if the list is empty
-
-    # Replace matched words with asterisks
-    return sensitive_words_regex.sub(lambda match: '*' * len(match.group()), message)
-
-# Flatten and clean the sensitive words list
-def read_sensitive_words(filename):
-    with open(filename, 'r', newline='') as csvfile:
-        csv_reader = csv.reader(csvfile)
-        for row in csv_reader:
-            sensitive_words.extend(word.strip() for word in row if word.strip())
-
-# Initialize sensitive words and compile the regex
-sensitive_words = []
-read_sensitive_words('en/pornography.csv')
-read_sensitive_words('en/violence.csv')
-read_sensitive_words('en/vulgar.csv')
-sensitive_words_regex = compile_sensitive_words(sensitive_words)
+    # Replace listed words with asterisks
+    return word_filter.mask(message)
+
+# Flatten and clean the sensitive words lists
+def read_sensitive_words(filenames):
+    sensitive_words = []
+    for filename in filenames:
+        with open(filename, 'r', newline='') as csvfile:
+            csv_reader = csv.reader(csvfile)
+            for row in csv_reader:
+                sensitive_words.extend(word.strip() for word in row if word.strip())
+    return sensitive_words
+
+def load_word_filter():
+    return WordFilter(read_sensitive_words(SENSITIVE_WORD_FILES))
+
+word_filter = load_word_filter()
+
+async def reload_word_filter():
+    """
+    Rebuild the filter from the word lists and swap it in. Messages being
+    filtered meanwhile keep using the previous one.
+    """
+    global word_filter
+    word_filter = await asyncio.to_thread(load_word_filter)
+    return len(word_filter)
+
+# the last global messages, so joining needs no database read
+recent_messages = deque(maxlen=CHAT_BACKLOG_SIZE)
+recent_messages_frame = None  # serialized backlog, rebuilt after the next change
+
+def record_recent_message(message: ChatMessage):
+    """
+    Add a global message to the backlog. Returns False if it was already there:
+    a client that both broadcasts a message and saves it through /send gives
+    both copies the same client_message_id, and the second copy is skipped.
+    Messages without an id are always added.
+    """
+    global recent_messages_frame
+    if message.client_message_id is not None:
+        for recent in recent_messages:
+            if recent.client_message_id == message.client_message_id and recent.username == message.username:
+                return False
+    recent_messages.append(message)
+    recent_messages_frame = None
+    return True
+
+async def load_recent_messages():
+    """
+    Fill the backlog from the database once, at startup.
+    """
+    global recent_messages_frame
+    latest = []
+    documents = global_chat_collection.find({}, HISTORY_FIELDS).sort([("timestamp", -1), ("_id", -1)])
+    async for message in documents.limit(CHAT_BACKLOG_SIZE):
+        latest.append(ChatMessage(**message))
+    recent_messages.extend(reversed(latest))
+    recent_messages_frame = None
+
+def chat_backlog_frame():
+    global recent_messages_frame
+    if recent_messages_frame is None:
+        # same shape as /history, oldest first
+        recent_messages_frame = json.dumps({
+            "type": "chat_backlog",
+            "messages": [message.model_dump(mode="json") for message in recent_messages]
+        })
+    return recent_messages_frame
+
+# channel membership, so a message costs as much as its channel has members, not everyone online
+chat_global = {}  # websocket -> session, everyone unless they left the global channel
+chat_regions = {}  # geohash region -> {websocket: session}
+
+def set_chat_region(session, region):
+    if session.region == region:
+        return
+    leave_region(session)
+    session.region = region
+    if region is not None:
+        chat_regions.setdefault(region, {})[session.websocket] = session
+        session.outbox.put(json.dumps({"type": "chat_region", "region": region}))
+
+def leave_region(session):
+    members = chat_regions.get(session.region)
+    if members is not None:
+        members.pop(session.websocket, None)
+        if not members:
+            del chat_regions[session.region]
+
+def move_chat_user(username, region):
+    # called by the location router when the user's live location crosses into another region
+    for session in active_connected_users.sessions_for(username):
+        set_chat_region(session, region)
+
+region_listeners.append(move_chat_user)
+
+def set_global_membership(session, joined: bool):
+    session.in_global = joined
+    if joined:
+        chat_global[session.websocket] = session
+    else:
+        chat_global.pop(session.websocket, None)
 
 @router.get("/guestUsername")
-def get_unique_guest_username():
-    global guestIndex
-    guestIndex += 1
+async def get_unique_guest_username():
+    # the counter lives in the broadcast backend so guest names stay unique across workers
+    guestIndex = await broadcast_backend.incr("guest_index")
     return f"Guest{guestIndex}"
 
 @router.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     await websocket.accept()
-    global guestIndex
+    session = None
     try:
         # everytime a user connects it would send a message to authenticate itself
         raw_message = await websocket.receive_text()
         auth_message = json.loads(raw_message)  # Parse JSON message
         if auth_message.get("type") == "auth":
-            token = auth_message.get("token")
-            if token[:5] == 'Guest':
-                username = token
-                
-            else:
-                username = verify_token(token)
-            active_connected_users.append((username,websocket))
+            # verified once here, the messages that follow are bound to this session
+            username, expires_at, user_type = socket_identity(auth_message.get("token"))
+            session = active_connected_users.add(ChatSession(username, websocket, expires_at, user_type))
+            # chat keeps its order: a client that falls behind loses the oldest messages first
+            session.outbox = Outbox(
+                websocket.send_text, "chat", policy="drop_oldest",
+                on_evict=evict_socket(websocket, disconnect_chat_user)
+            )
+            # the first frame after auth is the recent backlog, queued ahead of any live message
+            session.outbox.put(chat_backlog_frame())
+            set_global_membership(session, True)
+            set_chat_region(session, location_regions.get(username))
+            schedule_token_refresh(session)
         while True:
             # asynch operation that blocks untiwdl a message is received from user
             raw_message = await websocket.receive_text()
             message = json.loads(raw_message)  # Parse JSON message
-            if message.get("type") == "chat_message":
-                await broadcast_chat_update(message)
+            if session is None:
+                continue
+            if message.get("type") == "auth":
+                reauthenticate(session, message.get("token"))
+            elif not session_is_current(session):
+                reject_expired(session)
+            elif message.get("type") == "chat_message" and message.get("channel") == "region":
+                await broadcast_region_update(session, message)
+            elif message.get("type") == "chat_message":
+                await broadcast_chat_update(session, message)
+            elif message.get("type") in ("join_channel", "leave_channel") and message.get("channel") == "global":
+                # {"type": "leave_channel", "channel": "global"} keeps only the regional channel
+                set_global_membership(session, message["type"] == "join_channel")
             elif message.get("type") == "private_message":
                 
-                await send_private_message(message)
+                await send_private_message(session, message)
     except WebSocketDisconnect:
-        for users in active_connected_users:
-            if users[1] == websocket:
-                active_connected_users.remove(users)
-                break
-        print("User disconnected from incident updates")
+        print("User disconnected from chat")
+    finally:
+        disconnect_chat_user(websocket)
 
 
-async def broadcast_chat_update(new_message: dict):
-    if new_message.get("token")[0:5] == 'Guest':
-        username = new_message.get("token")
-    else:
-        username = verify_token(new_message.get("token"))
+def disconnect_chat_user(websocket):
+    session = active_connected_users.remove(websocket)
+    if session is not None:
+        cancel_token_refresh(session)
+        session.outbox.close()
+        chat_global.pop(websocket, None)
+        leave_region(session)
+
+
+def prepare_chat_message(sender, new_message: dict, message_type: str):
+    username = sender.username
+    new_message.pop("token", None)  # the session already knows who sent it, peers never need the token
 
     message = new_message.get("message")
-    new_message["messageType"] = "global"
+    new_message["messageType"] = message_type
     message["username"] = username if username else "Anonymous"
     message["isOwn"] = False
     message["text"] = filter_message(message["text"])
-    for connection in active_connected_users:
-        if message["username"] == connection[0]:
-            pass
-        else:
-            await connection[1].send_json(new_message)
+    return message
 
 
-async def send_private_message(new_message: dict):
-    if new_message.get("token")[0:5] == 'Guest':
-        username = new_message.get("token")
-    else:
-        username = verify_token(new_message.get("token"))
-    select_receiver = new_message.get("receiver")
+async def broadcast_chat_update(sender, new_message: dict):
+    message = prepare_chat_message(sender, new_message, "global")
+    deliver_chat_update(new_message)
+    client_message_id = message.get("clientMessageId")
+    recent = ChatMessage(
+        username=message["username"], message=message["text"],
+        client_message_id=client_message_id[:64] if isinstance(client_message_id, str) else None
+    )
+    record_recent_message(recent)
+    await broadcast_backend.publish("chat", {
+        "kind": "global", "message": new_message, "recent": recent.model_dump(mode="json")
+    })
+
+
+def deliver_chat_update(new_message: dict):
+    deliver_to_channel(chat_global, new_message)
+
+
+async def broadcast_region_update(sender, new_message: dict):
+    """
+    Send a message to the users in the sender's region only.
+    """
+    if sender.region is None:
+        sender.outbox.put(json.dumps({"type": "chat_error", "detail": "Share your location to chat with your region"}))
+        return
+    prepare_chat_message(sender, new_message, "region")
+    new_message["region"] = sender.region
+    deliver_region_update(new_message)
+    await broadcast_backend.publish("chat", {"kind": "region", "message": new_message})
+
+
+def deliver_region_update(new_message: dict):
+    deliver_to_channel(chat_regions.get(new_message["region"], {}), new_message)
+
+
+def deliver_to_channel(members, new_message: dict):
+    # serialized once and only queued here, each socket's writer sends it at its own pace
+    payload = json.dumps(new_message)
+    # a copy, as a client that is too far behind is evicted from the channel on put
+    for session in list(members.values()):
+        if new_message["message"]["username"] != session.username:
+            session.outbox.put(payload)
+
+
+async def send_private_message(sender, new_message: dict):
+    username = sender.username
+    new_message.pop("token", None)
     new_message["messageType"] = "private"
     message = new_message.get("message")
     message["username"] = username if username else "Anonymous"
     message["isOwn"] = False
     new_message["messageSender"] = username
-    for connection in active_connected_users:
-        if select_receiver == connection[0]:
-            await connection[1].send_json(new_message)
-            break
+    if not deliver_private_message(new_message):
+        # the receiver may be connected to another worker
+        await broadcast_backend.publish("chat", {"kind": "private", "message": new_message})
+
+
+def deliver_private_message(new_message: dict):
+    receiver = active_connected_users.first(new_message.get("receiver"))
+    if receiver is None:
+        return False
+    receiver.outbox.put(json.dumps(new_message))
+    return True
+
+
+async def handle_remote_chat(event):
+    if event["kind"] == "global":
+        deliver_chat_update(event["message"])
+        record_recent_message(ChatMessage(**event["recent"]))
+    elif event["kind"] == "region":
+        deliver_region_update(event["message"])
+    elif event["kind"] == "recent":
+        record_recent_message(ChatMessage(**event["message"]))
+    elif event["kind"] == "private":
+        deliver_private_message(event["message"])
+    elif event["kind"] == "reload_filter":
+        await reload_word_filter()
+
+broadcast_backend.subscribe("chat", handle_remote_chat)
 
 @router.post("/send")
 async def send_message(message: ChatMessage):
@@ -121,24 +298,118 @@ async def send_message(message: ChatMessage):
     message.username = verify_token(message.username) if message.username[:5] != 'Guest' else message.username
     try:
         message.message = filter_message(message.message)
-        await global_chat_collection.insert_one(message.model_dump())
+        chat_writer.add(message.model_dump())
+        if record_recent_message(message):
+            await broadcast_backend.publish("chat", {"kind": "recent", "message": message.model_dump(mode="json")})
         return {"message": "Message sent successfully"}
+    except WriteBufferFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Chat is overloaded, try again: {str(e)}",
+            headers={"Retry-After": "1"}
+        )
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Message is too long: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+HISTORY_STREAM_BATCH = 500  # documents the NDJSON stream holds in memory at a time
+HISTORY_FIELDS = {"username": 1, "message": 1, "timestamp": 1, "client_message_id": 1}
+
+def encode_history_cursor(message):
+    # opaque to clients: the (timestamp, _id) of the last message they received
+    raw = f"{message['timestamp'].isoformat()}|{message['_id']}"
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str):
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(message_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def history_query(last_login_time, cursor, newest_first):
+    """
+    Keyset pagination on (timestamp, _id), served by the index from init_chat_indexes,
+    so a page costs the same however deep into the history it is.
+    """
+    clauses = []
+    if last_login_time:
+        clauses.append({"timestamp": {"$gt": last_login_time}})
+    if cursor:
+        timestamp, message_id = decode_history_cursor(cursor)
+        after = "$lt" if newest_first else "$gt"
+        clauses.append({"$or": [
+            {"timestamp": {after: timestamp}},
+            {"timestamp": timestamp, "_id": {after: message_id}}
+        ]})
+    query = {"$and": clauses} if len(clauses) > 1 else (clauses[0] if clauses else {})
+    direction = -1 if newest_first else 1
+    return query, [("timestamp", direction), ("_id", direction)]
+
 @router.get("/history", response_model=List[ChatMessage])
-async def get_chat_history(last_login_time: Optional[datetime] = None):
+async def get_chat_history(
+    response: Response,
+    last_login_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    newest_first: bool = False
+):
+    """
+    One page of global chat, oldest first unless newest_first is set.
+    Without a cursor it is the latest page: the newest `limit` messages
+    (after last_login_time if given), still oldest first in the body unless
+    newest_first is set, and X-Prev-Cursor holds the cursor for the older
+    messages, to pass with newest_first=true. With a cursor, X-Next-Cursor
+    holds the cursor for the next page in the same direction.
+    Either header is only present when more messages follow.
+    """
+    # a first page without newest_first is read backwards from the latest message and then reversed
+    latest_page = cursor is None and not newest_first
+    query, sort = history_query(last_login_time, cursor, newest_first or latest_page)
     try:
         messages = []
-        query = {}
-        if last_login_time:
-            query = {"timestamp": {"$gt": last_login_time}}
-        async for message in global_chat_collection.find(query).sort("timestamp", 1):
-            messages.append(ChatMessage(**message))
-        return messages
+        # one extra document tells whether there is a next page
+        async for message in global_chat_collection.find(query, HISTORY_FIELDS).sort(sort).limit(limit + 1):
+            messages.append(message)
+        if len(messages) > limit:
+            messages = messages[:limit]
+            header = "X-Prev-Cursor" if latest_page else "X-Next-Cursor"
+            response.headers[header] = encode_history_cursor(messages[-1])
+        if latest_page:
+            messages.reverse()
+        return [ChatMessage(**message) for message in messages]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@router.get("/history/stream")
+async def stream_chat_history(
+    last_login_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    newest_first: bool = False
+):
+    """
+    The same history as NDJSON, one message per line, for bulk consumers.
+    Documents are read in batches, so memory stays flat however long the stream.
+    Every line carries its cursor, so an interrupted download can resume after it.
+    """
+    query, sort = history_query(last_login_time, cursor, newest_first)
+    documents = global_chat_collection.find(query, HISTORY_FIELDS, batch_size=HISTORY_STREAM_BATCH).sort(sort)
+    if limit:
+        documents = documents.limit(limit)
+
+    async def lines():
+        async for message in documents:
+            line = ChatMessage(**message).model_dump(mode="json")
+            line["cursor"] = encode_history_cursor(message)
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 # Keep the original total messages endpoint for backward compatibility
 @router.get("/total_messages", response_model=int)
 async def get_total_messages():
@@ -155,7 +426,35 @@ async def get_active_users_count():
         return {"active_users_count": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/active_users/stats")
+async def get_active_users_stats():
+    stats = active_connected_users.stats()
+    stats["queues"] = outbox_stats("chat", (session.outbox for session in active_connected_users))
+    stats["writes"] = chat_writer.stats()
+    stats["channels"] = {
+        "global": len(chat_global),
+        "regions": len(chat_regions),
+        "largest_region": max(map(len, chat_regions.values()), default=0)
+    }
+    return stats
 # Add our new admin endpoints
+@router.post("/filter/reload")
+async def reload_chat_filter(current_user = Depends(get_current_admin_user)):
+    """
+    Re-read the sensitive word lists on every worker, without a restart.
+    Only accessible by admin users.
+    """
+    try:
+        words = await reload_word_filter()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error reloading word lists: {str(e)}"
+        )
+    await broadcast_backend.publish("chat", {"kind": "reload_filter"})
+    return {"sensitive_words": words}
+
 @router.get("/messages/total")
 async def get_admin_total_messages(current_user = Depends(get_current_admin_user)):
     """
@@ -0,0 +1,24 @@
+import httpx
+
+http_client = None
+
+
+def get_http_client():
+    """
+    Shared pooled AsyncClient so outbound API calls reuse connections
+    instead of opening a new one per request.
+    """
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    return http_client
+
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
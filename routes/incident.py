@@ -1,15 +1,26 @@
-from model import IncidentReport, IncidentStatusUpdate, LocationCheck, RouteDelayRequest, NearbyIncidentsResponse, TrafficCard
+from model import IncidentReport, IncidentStatusUpdate, LocationCheck, RouteDelayRequest, NearbyIncidentsResponse, TrafficCard, IncidentClustersResponse
 from fastapi import APIRouter, HTTPException, Query,WebSocket, WebSocketDisconnect
 from datetime import datetime, timedelta
-from .navigate import reverse_geocode, calculate_distance
+from .navigate import reverse_geocode_async
 from .auth import verify_token
-from database import incident_report_collection, client, user_collection
+from database import incident_report_collection, incident_archive_collection, client, user_collection
 from bson import ObjectId
-import requests
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 from config import GOOGLE_MAPS_API_KEY
 from typing import List
-from .calculatedistance import calculate_distance
+from .spatialgrid import SpatialGrid, ViewportIndex
+from .incidentfeed import IncidentFeed
+from .broadcaster import Broadcaster
+from .binaryframes import encode_incident_message
+from .routedelay import distances_to_route, route_bounding_box
+from .incidentcluster import TileClusterCache, tiles_in_bbox, MAX_ZOOM
+from .asynccache import TTLCache
+from .httpclient import get_http_client
+from .pubsub import broadcast_backend
+import asyncio
 import json
+import re
 
 router = APIRouter()
 
@@ -23,48 +34,262 @@ INCIDENT_DELAYS = {
     "police": timedelta(minutes=5)
 }
 
-active_connected_users = [] # stores a list of connected users
+# How long an unconfirmed incident stays active; each repeated report extends it again
+INCIDENT_LIFETIMES = {
+    "pothole": timedelta(days=3),
+    "accident": timedelta(hours=2),
+    "breakdown": timedelta(hours=1),
+    "oilspill": timedelta(hours=3),
+    "roadblock": timedelta(hours=6),
+    "speedcamera": timedelta(days=7),
+    "police": timedelta(hours=2)
+}
+DEFAULT_INCIDENT_LIFETIME = timedelta(hours=2)
+EXPIRY_SWEEP_INTERVAL = 60  # seconds between expiry sweeps
+EXPIRY_BATCH_SIZE = 500
+ARCHIVE_AFTER = timedelta(days=1)  # cleared incidents older than this leave the hot collection
+GEOCODE_CONCURRENCY = 2  # Nominatim asks for gentle use, so enrichment lookups are throttled
+
+TRAFFIC_CACHE_TTL = 120  # seconds a traffic card stays fresh
+TRAFFIC_SNAP_DECIMALS = 3  # origin/destination cells of roughly 100m
+traffic_cards_cache = TTLCache(ttl=TRAFFIC_CACHE_TTL)
+MIN_TRAFFIC_SEGMENT_M = 200  # shorter segments are too noisy to rate
+MAX_TRAFFIC_CARDS = 5
+DIRECTION_WORDS = {
+    "north", "south", "east", "west", "northeast", "northwest", "southeast", "southwest",
+    "left", "right", "slight left", "slight right", "sharp left", "sharp right"
+}
+
+enrichment_tasks = set()  # keeps background place name lookups alive until they finish
+geocode_semaphore = asyncio.Semaphore(GEOCODE_CONCURRENCY)
+
+# sockets connected to the incident updates, each drained by its own writer; a client that
+# misses deltas because its queue overflowed sees a version gap and resyncs
+incident_broadcaster = Broadcaster("incidents", policy="drop_oldest")
+INCIDENT_BROADCAST_WINDOW = 0.25  # seconds a burst of changes is collected into one delta
+incident_flush_task = None
+# map viewports of clients that only want incidents inside their bbox, keyed by websocket
+incident_subscriptions = ViewportIndex(cell_size_deg=0.25)
+VIEWPORT_MARGIN = 0.2  # fraction of the viewport added on each side so small pans need no resubscribe
+removed_incident_locations = {}  # incident_id -> [lat, lng] until its removal has been routed
+
+# In-memory grid of uncleared incidents so radius queries only visit nearby cells
+active_incidents = SpatialGrid(cell_size_deg=0.1)
+active_incidents_loaded = False
+active_incidents_lock = asyncio.Lock()
+# Per-tile clusters for the map layers, dropped whenever an incident in the tile changes
+incident_clusters = TileClusterCache(active_incidents)
+MAX_CLUSTER_TILES = 64
+# Versioned log of changes to the active incidents, streamed to clients as deltas
+incident_feed = IncidentFeed()
+
+def track_incident(incident):
+    """
+    Add or refresh an incident document in the active incident index.
+    """
+    return track_item(incident_item(incident))
+
+def incident_item(incident):
+    """
+    The fields of an incident document kept in the active incident index.
+    """
+    return {
+        "incident_id": str(incident["_id"]),
+        "incident_type": incident["incident_type"],
+        "incident_text": incident.get("incident_text", incident["incident_type"]),
+        "lat": incident["lat"],
+        "lng": incident["lng"],
+        "delay_minutes": incident.get("delay_minutes", 0),
+        "reported_at": incident.get("reported_at"),
+        "place_name": incident.get("place_name", "Unknown location")
+    }
+
+def track_item(item):
+    previous = active_incidents.get(item["incident_id"])
+    if previous is not None:
+        incident_clusters.invalidate(previous["lat"], previous["lng"])
+    active_incidents.add(item["incident_id"], item["lat"], item["lng"], item)
+    incident_clusters.invalidate(item["lat"], item["lng"])
+    return item
+
+def format_incident(item):
+    """
+    Shape of an incident as sent to the incident WebSocket clients.
+    """
+    return {
+        "incident_id": item["incident_id"],
+        "type": item["incident_type"],
+        "location": [item["lat"], item["lng"]],
+        "reported_at": item["reported_at"],
+        "place_name": item["place_name"],
+        "delay_minutes": item["delay_minutes"]
+    }
+
+def untrack_incident(incident_id):
+    item = active_incidents.remove(str(incident_id))
+    if item is not None:
+        incident_clusters.invalidate(item["lat"], item["lng"])
+    return item
+
+async def untrack_incidents(incident_ids):
+    """
+    Drop incidents from the active incident index and return them formatted
+    for a removal broadcast. Incidents this worker was not tracking, e.g.
+    because its index is not loaded yet, are read from the database, so the
+    other workers and their clients still hear about the removal.
+    """
+    removed = []
+    untracked = []
+    for incident_id in incident_ids:
+        item = untrack_incident(incident_id)
+        if item is not None:
+            removed.append(format_incident(item))
+        else:
+            untracked.append(ObjectId(incident_id))
+    if untracked:
+        async for incident in incident_report_collection.find({"_id": {"$in": untracked}}):
+            removed.append(format_incident(incident_item(incident)))
+    return removed
+
+async def sync_incident_status(incident_id, cleared: bool):
+    """
+    Keep the active incident index in line with a status change and
+    let the incident WebSocket clients know.
+    """
+    if cleared:
+        removed = await untrack_incidents([incident_id])
+        if removed:
+            await broadcast_incidents_update(removed=removed)
+    else:
+        incident = await incident_report_collection.find_one({"_id": ObjectId(incident_id)})
+        if incident:
+            known = str(incident["_id"]) in active_incidents
+            item = format_incident(track_incident(incident))
+            if known:
+                await broadcast_incidents_update(updated=[item])
+            else:
+                await broadcast_incidents_update(added=[item])
+
+async def load_active_incidents():
+    """
+    Populate the active incident index from the database on first use.
+    """
+    global active_incidents_loaded
+    if active_incidents_loaded:
+        return
+    async with active_incidents_lock:
+        if active_incidents_loaded:
+            return
+        async for incident in incident_report_collection.find({"incident_status_cleared": False}):
+            track_incident(incident)
+        active_incidents_loaded = True
 
 class Report:
     def __init__(self,incident_id):
         self.inserted_id = incident_id
 
+DUPLICATE_RADIUS_M = 100
+EARTH_RADIUS_M = 6378100  # radius MongoDB uses for $centerSphere
+
+def incident_location(lat, lng):
+    """
+    GeoJSON point stored on each incident for the 2dsphere index.
+    """
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+def incident_expiry(incident_type, now=None):
+    return (now or datetime.utcnow()) + INCIDENT_LIFETIMES.get(incident_type, DEFAULT_INCIDENT_LIFETIME)
+
+def status_update(cleared: bool):
+    """
+    Update document for clearing or reopening an incident.
+    A reopened incident gets at least a fresh default lifetime so the sweeper does not expire it right away.
+    """
+    now = datetime.utcnow()
+    if cleared:
+        return {"$set": {"incident_status_cleared": True, "cleared_at": now}}
+    return {
+        "$set": {"incident_status_cleared": False},
+        "$unset": {"cleared_at": "", "cleared_reason": ""},
+        "$max": {"expires_at": now + DEFAULT_INCIDENT_LIFETIME}
+    }
+
+CONFIRMATION_THRESHOLD = 3  # confirmations after which every reporter is rewarded
+CONFIRMATION_POINTS = 2
+
+async def award_confirmation_points(previous_times, previous_users, username):
+    """
+    Reward a new confirmation in a single write. previous_times and previous_users
+    come from the atomic update that recorded it, so only one confirmation ever sees
+    the threshold and the payout to earlier reporters happens exactly once.
+    """
+    if previous_times == CONFIRMATION_THRESHOLD:
+        recipients = list(previous_users) + [username]
+    elif previous_times > CONFIRMATION_THRESHOLD: # only update new one
+        recipients = [username]
+    else:
+        return
+    await user_collection.update_many({"username": {"$in": recipients}}, {"$inc": {"points": CONFIRMATION_POINTS}})
+
 async def check_incident(new_incident,username):
     """
     Check if the incident already exists in the database.
     If it does, update the existing record instead of creating a new one.
     """
-    existing_incidents = await incident_report_collection.find({"incident_status_cleared": False, "incident_type":new_incident["incident_type"]}).to_list(length=None)
-    for incident in existing_incidents:
-        distance = calculate_distance(
-            new_incident["lat"],
-            new_incident["lng"],
-            incident["lat"],
-            incident["lng"]
-        )
-        if distance < 100:
-            for user in incident["users"]:
-                if user == username: # this means the same user report the same incident
-                    result = Report(incident["_id"])
-                    return (True, result)
-
-            # if incident is report by another user 
-            if incident["times"] == 3:
-                for user in incident["users"]:
-                    await user_collection.update_one({"username": user}, {"$inc": {"points": 2}})
-                await user_collection.update_one({"username": username}, {"$inc": {"points": 2}}) # update for current user
-            elif incident["times"] > 3: # only update new one
-                await user_collection.update_one({"username": username}, {"$inc": {"points": 2}}) # update for current user
-                
-            await incident_report_collection.update_one(
-                {"_id": incident["_id"]},
-                {"$inc": {"times": 1},
-                 "$push": {"users": username}
-                }, # $inc is used to increment the times field
-            )
-            result = Report(incident["_id"])
-            return (True, result )
-    return (False, None)
+    # One bounded geo query finds the open incident of the same type within 100m and,
+    # unless this user already reported it, records the confirmation in the same atomic write
+    reporters = {"$ifNull": ["$users", []]}
+    already_reported = {"$in": [{"$literal": username}, reporters]}
+    incident = await incident_report_collection.find_one_and_update(
+        {
+            "incident_status_cleared": False,
+            "incident_type": new_incident["incident_type"],
+            "location": {"$geoWithin": {"$centerSphere": [
+                [new_incident["lng"], new_incident["lat"]], DUPLICATE_RADIUS_M / EARTH_RADIUS_M
+            ]}}
+        },
+        [{"$set": {
+            "expires_at": {"$max": ["$expires_at", incident_expiry(new_incident["incident_type"])]},
+            "times": {"$cond": [already_reported, "$times", {"$add": ["$times", 1]}]},
+            "users": {"$cond": [already_reported, reporters, {"$concatArrays": [reporters, [{"$literal": username}]]}]}
+        }}],
+        projection={"times": 1, "users": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if incident is None:
+        return (False, None)
+
+    result = Report(incident["_id"])
+    reported_by = incident.get("users", [])
+    if username in reported_by: # this means the same user report the same incident
+        return (True, result)
+
+    # if incident is report by another user
+    await award_confirmation_points(incident.get("times", 0), reported_by, username)
+    return (True, result )
+
+async def enrich_place_name(incident_id, lat, lng):
+    """
+    Resolve the place name of a stored incident, patch the document and push the update to clients.
+    """
+    try:
+        async with geocode_semaphore:
+            # Round coordinates for consistent reverse geocoding
+            place_name = await reverse_geocode_async(round(lat, 5), round(lng, 5))
+        if place_name == "Unknown location":
+            return
+        await incident_report_collection.update_one({"_id": incident_id}, {"$set": {"place_name": place_name}})
+        item = active_incidents.get(str(incident_id))
+        if item is not None:
+            item["place_name"] = place_name
+            await broadcast_incidents_update(updated=[format_incident(item)])
+    except Exception as e:
+        print(f"Error enriching incident {incident_id}: {e}")
+
+def schedule_place_enrichment(incident_id, lat, lng):
+    task = asyncio.create_task(enrich_place_name(incident_id, lat, lng))
+    enrichment_tasks.add(task)
+    task.add_done_callback(enrichment_tasks.discard)
 
 @router.post("/api/report-incident/{token}")
 async def report_incident(token:str,report: IncidentReport):
@@ -72,11 +297,10 @@ async def report_incident(token:str,report: IncidentReport):
     try:
         report_data = report.dict()
         report_data["reported_at"] = datetime.utcnow().isoformat() + "Z"
-        # Round coordinates for consistent reverse geocoding
-        lat = round(report_data["lat"], 5)
-        lng = round(report_data["lng"], 5)
-        place_name = reverse_geocode(lat, lng)
-        report_data["place_name"] = place_name
+        # The place name is resolved in the background once the report is stored
+        report_data["place_name"] = "Unknown location"
+        report_data["location"] = incident_location(report_data["lat"], report_data["lng"])
+        report_data["expires_at"] = incident_expiry(report_data["incident_type"])
         # Calculate delay based on incident type
         delay = INCIDENT_DELAYS.get(report_data["incident_type"], timedelta(0))
         report_data["delay_minutes"] = int(delay.total_seconds() / 60)
@@ -88,9 +312,9 @@ async def report_incident(token:str,report: IncidentReport):
         else:
             report_data["users"] = [username]  
             result = await incident_report_collection.insert_one(report_data)
-        
-        # Fetch all incidents and broadcast the updated list
-        await broadcast_incidents_update()
+            # Only a new incident changes what clients see; confirmations just bump the count
+            await broadcast_incidents_update(added=[format_incident(track_incident(report_data))])
+            schedule_place_enrichment(result.inserted_id, report_data["lat"], report_data["lng"])
 
         return {
             "message": "Incident recorded", 
@@ -100,28 +324,116 @@ async def report_incident(token:str,report: IncidentReport):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def broadcast_incidents_update():
+async def incident_snapshot():
     """
-    Update the incident state to all connected users
+    Full state message a client starts from before applying deltas.
     """
-    incidents = await incident_report_collection.find({"incident_status_cleared": False}).to_list(length=None)
-    formatted_incidents = [
-        {
-            "incident_id": str(inc["_id"]),
-            "type": inc["incident_type"],
-            "location": [inc["lat"], inc["lng"]],
-            "reported_at": inc.get("reported_at"),
-            "place_name": inc.get("place_name", "Unknown location"),
-            "delay_minutes": inc.get("delay_minutes", None)
-        }
-        for inc in incidents
-    ]
-   
-    for connection in active_connected_users:
-        try:
-            await connection.send_json(formatted_incidents)
-        except Exception as e:
-            print(f"Error sending message: {e}")
+    await load_active_incidents()
+    return {
+        "type": "snapshot",
+        "version": incident_feed.version,
+        "incidents": [format_incident(item) for item in active_incidents.values()]
+    }
+
+async def viewport_snapshot(subscription):
+    await load_active_incidents()
+    return {
+        "type": "snapshot",
+        "version": incident_feed.version,
+        "bbox": subscription["bbox"],
+        "incidents": [format_incident(item) for item in active_incidents.query_bbox(*subscription["bbox"])]
+    }
+
+async def subscribe_viewport(websocket, bbox, zoom=None):
+    """
+    Limit a socket to the incidents inside its map viewport and return the
+    snapshot it starts from.
+    """
+    south, west, north, east = (float(value) for value in bbox)
+    pad_lat = (north - south) * VIEWPORT_MARGIN
+    pad_lng = (east - west) * VIEWPORT_MARGIN
+    padded = [south - pad_lat, west - pad_lng, north + pad_lat, east + pad_lng]
+    subscription = {"bbox": padded, "zoom": zoom, "version": incident_feed.version}
+    incident_subscriptions.set(websocket, *padded, subscription)
+    return await viewport_snapshot(subscription)
+
+def route_to_viewports(delta):
+    """
+    Split a delta into the part each viewport subscriber can see.
+    Subscribers with nothing in view are left out entirely.
+    """
+    routed = {}
+    def changes_for(websocket):
+        return routed.setdefault(websocket, {"added": [], "updated": [], "removed": []})
+
+    for kind in ("added", "updated"):
+        for incident in delta[kind]:
+            lat, lng = incident["location"]
+            for websocket, subscription in incident_subscriptions.query_point(lat, lng):
+                changes_for(websocket)[kind].append(incident)
+    for incident_id in delta["removed"]:
+        location = removed_incident_locations.pop(incident_id, None)
+        if location is None:
+            continue
+        for websocket, subscription in incident_subscriptions.query_point(*location):
+            changes_for(websocket)["removed"].append(incident_id)
+
+    personal = {}
+    for websocket, changes in routed.items():
+        subscription = incident_subscriptions.get(websocket)
+        personal[websocket] = {"type": "delta", "version": delta["version"], "since": subscription["version"], **changes}
+        subscription["version"] = delta["version"]
+    return personal
+
+async def broadcast_incidents_update(added=(), updated=(), removed=()):
+    """
+    Stage a change to the active incidents. Changes arriving within
+    INCIDENT_BROADCAST_WINDOW are sent to all connected users as one versioned delta.
+    `removed` takes formatted incidents so the removal can be routed by location.
+    The other workers get the tracked items so they can update their own index too.
+    """
+    stage_incidents_update(added, updated, removed)
+    def tracked(incidents):
+        items = (active_incidents.get(incident["incident_id"]) for incident in incidents)
+        return [item for item in items if item is not None]
+    await broadcast_backend.publish("incidents", {"added": tracked(added), "updated": tracked(updated), "removed": list(removed)})
+
+async def handle_remote_incidents(change):
+    """
+    Apply a change made on another worker to this worker's index and clients.
+    """
+    for item in change["added"] + change["updated"]:
+        track_item(item)
+    for incident in change["removed"]:
+        untrack_incident(incident["incident_id"])
+    stage_incidents_update(
+        [format_incident(item) for item in change["added"]],
+        [format_incident(item) for item in change["updated"]],
+        change["removed"]
+    )
+
+broadcast_backend.subscribe("incidents", handle_remote_incidents)
+
+def stage_incidents_update(added=(), updated=(), removed=()):
+    global incident_flush_task
+    for incident in removed:
+        removed_incident_locations[incident["incident_id"]] = incident["location"]
+    incident_feed.stage(added, updated, [incident["incident_id"] for incident in removed])
+    if incident_flush_task is None:
+        incident_flush_task = asyncio.create_task(flush_incidents_update())
+
+async def flush_incidents_update():
+    global incident_flush_task
+    await asyncio.sleep(INCIDENT_BROADCAST_WINDOW)
+    # changes staged from here on start the next window
+    incident_flush_task = None
+    delta = incident_feed.flush()
+    if delta is not None:
+        # viewport subscribers only get what is in view, everyone else gets the shared delta
+        personal = route_to_viewports(delta)
+        incident_broadcaster.send(
+            delta, personal=personal, exclude=incident_subscriptions, encode_binary=encode_incident_message
+        )
 
 
 @router.put("/api/update-incident-status/{incident_id}/{token}")
@@ -130,30 +442,23 @@ async def update_incident_status(incident_id: str,token:str, update: IncidentSta
         # Convert string ID to ObjectId
         object_id = ObjectId(incident_id)
         username = verify_token(token)
-        existing_incident = await incident_report_collection.find_one({"_id": object_id})
-        if username in existing_incident["users"]:
-            pass
-        else:
-            if existing_incident["times"] == 3:
-                for user in existing_incident["users"]:
-                    await user_collection.update_one({"username": user}, {"$inc": {"points": 2}})
-                await user_collection.update_one({"username": username}, {"$inc": {"points": 2}}) # update for current user
-            elif existing_incident["times"] > 3: # only update new one
-                await user_collection.update_one({"username": username}, {"$inc": {"points": 2}}) # update for current user
-            await incident_report_collection.update_one(
-                {"_id": existing_incident["_id"]},
-                {"$inc": {"times": 1},
-                 "$push": {"users": username}
-                }, # $inc is used to increment the times field
-            )
+        # Record the confirmation unless this user already reported the incident;
+        # the document as it was before the update decides the payout
+        previous = await incident_report_collection.find_one_and_update(
+            {"_id": object_id, "users": {"$ne": username}},
+            {"$inc": {"times": 1}, "$push": {"users": username}},
+            projection={"times": 1, "users": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is not None:
+            await award_confirmation_points(previous.get("times", 0), previous.get("users", []), username)
         # Update the incident status in MongoDB
         result = await incident_report_collection.update_one(
             {"_id": object_id},
-            {"$set": {"incident_status_cleared": update.status}}
+            status_update(update.status)
         )
-        if update.status:
-            await broadcast_incidents_update()
-            
+        await sync_incident_status(object_id, update.status)
+
         return {"message": "Incident status updated successfully"}
     except Exception as e:
         print(f"Error updating incident status: {str(e)}")  # For debugging
@@ -161,75 +466,177 @@ async def update_incident_status(incident_id: str,token:str, update: IncidentSta
 
 
 
+async def expire_stale_incidents():
+    """
+    Clear active incidents whose lifetime has run out, in batches, and
+    broadcast their removal. Returns how many were expired.
+    """
+    now = datetime.utcnow()
+    expired = 0
+    while True:
+        batch = await incident_report_collection.find(
+            {"incident_status_cleared": False, "expires_at": {"$lte": now}}, {"_id": 1}
+        ).limit(EXPIRY_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+        ids = [doc["_id"] for doc in batch]
+        result = await incident_report_collection.update_many(
+            # repeating the expiry check skips incidents confirmed since the find
+            {"_id": {"$in": ids}, "incident_status_cleared": False, "expires_at": {"$lte": now}},
+            {"$set": {"incident_status_cleared": True, "cleared_at": now, "cleared_reason": "expired"}}
+        )
+        if result.modified_count != len(ids):
+            ids = [doc["_id"] async for doc in incident_report_collection.find(
+                {"_id": {"$in": ids}, "cleared_reason": "expired", "cleared_at": now}, {"_id": 1}
+            )]
+        removed = await untrack_incidents(ids)
+        if removed:
+            await broadcast_incidents_update(removed=removed)
+        expired += len(ids)
+        if len(batch) < EXPIRY_BATCH_SIZE:
+            break
+    return expired
+
+async def archive_cleared_incidents():
+    """
+    Move incidents cleared more than ARCHIVE_AFTER ago into the archive
+    collection so the hot collection only holds recent incidents.
+    """
+    cutoff = datetime.utcnow() - ARCHIVE_AFTER
+    archived = 0
+    while True:
+        batch = await incident_report_collection.find(
+            {"incident_status_cleared": True, "cleared_at": {"$lte": cutoff}}
+        ).limit(EXPIRY_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+        try:
+            await incident_archive_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # documents already archived by an earlier, interrupted sweep
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        ids = [doc["_id"] for doc in batch]
+        # repeating the selection keeps an incident reopened since the find in the hot collection
+        result = await incident_report_collection.delete_many(
+            {"_id": {"$in": ids}, "incident_status_cleared": True, "cleared_at": {"$lte": cutoff}}
+        )
+        if result.deleted_count != len(ids):
+            # and drops its archived copy, which still says cleared
+            reopened = [doc["_id"] async for doc in incident_report_collection.find({"_id": {"$in": ids}}, {"_id": 1})]
+            await incident_archive_collection.delete_many({"_id": {"$in": reopened}})
+        archived += result.deleted_count
+        if len(batch) < EXPIRY_BATCH_SIZE:
+            break
+    return archived
+
+async def backfill_incident_expiry():
+    """
+    Give incidents stored before expiry existed a lifetime starting now,
+    and a clearing time to incidents cleared before cleared_at existed.
+    """
+    now = datetime.utcnow()
+    for incident_type, lifetime in INCIDENT_LIFETIMES.items():
+        await incident_report_collection.update_many(
+            {"incident_status_cleared": False, "incident_type": incident_type, "expires_at": {"$exists": False}},
+            {"$set": {"expires_at": now + lifetime}}
+        )
+    await incident_report_collection.update_many(
+        {"incident_status_cleared": False, "expires_at": {"$exists": False}},
+        {"$set": {"expires_at": now + DEFAULT_INCIDENT_LIFETIME}}
+    )
+    await incident_report_collection.update_many(
+        {"incident_status_cleared": True, "cleared_at": {"$exists": False}},
+        {"$set": {"cleared_at": now}}
+    )
+
+async def incident_expiry_loop():
+    """
+    Background task started with the app: expire stale incidents and archive old cleared ones.
+    """
+    await backfill_incident_expiry()
+    while True:
+        try:
+            expired = await expire_stale_incidents()
+            archived = await archive_cleared_incidents()
+            if expired or archived:
+                print(f"Incident sweep: {expired} expired, {archived} archived")
+        except Exception as e:
+            print(f"Incident sweep failed: {e}")
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL)
+
+async def count_all_incidents(query=None):
+    """
+    Count incidents in both the hot and the archive collection.
+    """
+    query = query or {}
+    return (
+        await incident_report_collection.count_documents(query)
+        + await incident_archive_collection.count_documents(query)
+    )
+
+
 @router.post("/api/calculate-route-delay")
 async def calculate_route_delay(request: RouteDelayRequest):
     try:
         total_delay = 0
         delay_breakdown = []
-        incidents = await incident_report_collection.find({
-            "incident_status_cleared": False
-        }).to_list(length=None)
-
-        def min_distance_to_route(incident_lat, incident_lng, route_coords):
-            return min(
-                calculate_distance(incident_lat, incident_lng, pt[0], pt[1])
-                for pt in route_coords
-            ) if route_coords else float('inf')
-
-        for incident in incidents:
-            # Only include incidents within 100m of any point on the route
-            min_dist = min_distance_to_route(incident['lat'], incident['lng'], request.coordinates)
-            if min_dist <= 100:  # 100 meters
-                delay = incident.get('delay_minutes', 0)
+        if not request.coordinates:
+            return {"total_delay_minutes": 0, "delay_breakdown": []}
+
+        await load_active_incidents()
+        # Only incidents inside the padded bounding box of the route are measured
+        candidates = active_incidents.query_bbox(*route_bounding_box(request.coordinates, 100))
+        distances = distances_to_route(
+            request.coordinates,
+            [incident['lat'] for incident in candidates],
+            [incident['lng'] for incident in candidates],
+            threshold_m=100
+        )
+
+        for incident, distance in zip(candidates, distances):
+            # Only include incidents within 100m of any segment of the route
+            if distance <= 100:  # 100 meters
+                delay = incident['delay_minutes']
                 total_delay += delay
                 delay_breakdown.append({
-                    "incident_id": str(incident['_id']),
+                    "incident_id": incident['incident_id'],
                     "type": incident['incident_type'],
                     "delay_minutes": delay,
                     "location": [incident['lat'], incident['lng']],
-                    "reported_at": incident.get("reported_at"),
-                    "place_name": incident.get("place_name", "Unknown location")
+                    "reported_at": incident['reported_at'],
+                    "place_name": incident['place_name']
                 })
         return {
             "total_delay_minutes": total_delay,
             "delay_breakdown": delay_breakdown
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 @router.post("/api/check-nearby-incidents", response_model=NearbyIncidentsResponse)
 async def check_nearby_incidents(location: LocationCheck):
     try:
-        # Get all incidents from the database that aren't cleared
-        incidents = await incident_report_collection.find(
-            {"incident_status_cleared": False}
-        ).to_list(length=None)
-        
+        await load_active_incidents()
+
         nearby_incidents = []
         total_delay = 0
 
-        for incident in incidents:
-            # Calculate distance between user and incident
-            distance = calculate_distance(
-                location.lat,
-                location.lng,
-                incident['lat'],
-                incident['lng']
-            )
-            
-            # If within 10 kilometers
-            if distance <= 10000:
-                delay = incident.get('delay_minutes', 0)
-                total_delay += delay
+        # Only the grid cells around the user are checked
+        for incident, distance in active_incidents.query_radius(location.lat, location.lng, 10000):
+            delay = incident['delay_minutes']
+            total_delay += delay
 
-                nearby_incidents.append({
-                    'incident_id': str(incident['_id']),
-                    'incident_type': incident['incident_type'],
-                    'incident_text': incident.get('incident_text', incident['incident_type']),
-                    'distance': round(distance, 2),
-                    'lat': incident['lat'],
-                    'lng': incident['lng'],
-                    'delay_minutes': delay
-                })
+            nearby_incidents.append({
+                'incident_id': incident['incident_id'],
+                'incident_type': incident['incident_type'],
+                'incident_text': incident['incident_text'],
+                'distance': round(distance, 2),
+                'lat': incident['lat'],
+                'lng': incident['lng'],
+                'delay_minutes': delay
+            })
         
         return {
             "nearby_incidents": nearby_incidents,
@@ -240,6 +647,40 @@ async def check_nearby_incidents(location: LocationCheck):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/api/incident-clusters", response_model=IncidentClustersResponse)
+async def get_incident_clusters(
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=MAX_ZOOM)
+):
+    try:
+        tiles = tiles_in_bbox(south, west, north, east, zoom, max_tiles=MAX_CLUSTER_TILES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        await load_active_incidents()
+        result = []
+        cluster_count = 0
+        incident_count = 0
+        for x, y in tiles:
+            clusters = incident_clusters.clusters(zoom, x, y)
+            if not clusters:
+                continue
+            cluster_count += len(clusters)
+            incident_count += sum(cluster["count"] for cluster in clusters)
+            result.append({"x": x, "y": y, "clusters": clusters})
+        return {
+            "zoom": zoom,
+            "tiles": result,
+            "cluster_count": cluster_count,
+            "incident_count": incident_count
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # @router.get("/api/all-incidents")
 # async def get_all_incidents():
 #     try:
@@ -264,9 +705,18 @@ async def check_nearby_incidents(location: LocationCheck):
 @router.websocket("/ws/all-incidents")
 async def websocket_all_incidents(websocket: WebSocket):
     await websocket.accept()
-    active_connected_users.append(websocket)
-    for user in active_connected_users:
-        print(f"User connected to incident updates{user}")
+    # /ws/all-incidents?format=binary switches every frame to the packed format in binaryframes.py
+    binary = websocket.query_params.get("format") == "binary"
+
+    def send(message):
+        # replies share the socket's outbox with the broadcasts, so they stay in order
+        incident_broadcaster.send_to(websocket, message, encode_binary=encode_incident_message)
+
+    # every client starts from a full snapshot and then only receives deltas
+    snapshot = await incident_snapshot()
+    incident_broadcaster.add(websocket, binary=binary)
+    send(snapshot)
+    print(f"User connected to incident updates, {len(incident_broadcaster)} connected")
         
     try:
         while True:
@@ -276,20 +726,96 @@ async def websocket_all_incidents(websocket: WebSocket):
 
 
             print(f"Received message: {message}")
+            subscription = incident_subscriptions.get(websocket)
             if message.get("type") == "get_incidents":
-                await broadcast_incidents_update()
+                if subscription:
+                    send(await viewport_snapshot(subscription))
+                else:
+                    send(await incident_snapshot())
+            elif message.get("type") == "resync":
+                # client saw a delta whose "since" did not match its version
+                if subscription:
+                    subscription["version"] = incident_feed.version
+                    send(await viewport_snapshot(subscription))
+                else:
+                    missed = incident_feed.since(message.get("version", -1))
+                    send(missed if missed is not None else await incident_snapshot())
+            elif message.get("type") == "subscribe":
+                # {"type": "subscribe", "bbox": [south, west, north, east], "zoom": 14}, resent as the map pans
+                send(await subscribe_viewport(websocket, message["bbox"], message.get("zoom")))
+            elif message.get("type") == "unsubscribe":
+                incident_subscriptions.remove(websocket)
+                send(await incident_snapshot())
 
     except WebSocketDisconnect:
-        active_connected_users.remove(websocket)
         print("User disconnected from incident updates")
+    finally:
+        incident_broadcaster.remove(websocket)
+        incident_subscriptions.remove(websocket)
 
 
+@router.get("/api/incident-updates/stats")
+async def incident_updates_stats():
+    return incident_broadcaster.stats()
 
-@router.get("/api/traffic-nearby", response_model=List[TrafficCard])
-def get_traffic_nearby(
-    origin: str = Query(..., description="lat,lng"),
-    destination: str = Query(..., description="lat,lng")
-):
+
+def snap_coordinate(value: str):
+    """
+    Round a "lat,lng" query value to a ~100m cell so nearby requests share a cache entry.
+    """
+    try:
+        lat, lng = (float(part) for part in value.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid coordinate: {value}")
+    return f"{round(lat, TRAFFIC_SNAP_DECIMALS)},{round(lng, TRAFFIC_SNAP_DECIMALS)}"
+
+def traffic_severity(delay_per_km):
+    if delay_per_km < 1:
+        return "Light"
+    elif delay_per_km < 2:
+        return "Medium"
+    return "Heavy"
+
+def step_road_name(step):
+    """
+    Road name of a Directions step, taken from the bold parts of its instructions
+    (e.g. "Turn <b>left</b> onto <b>Jalan Ampang</b>") so no geocoding call is needed.
+    The part after "on" or "onto" is the road the step drives along; otherwise the
+    first part that is not a direction, skipping the road it heads "toward".
+    """
+    instructions = step.get("html_instructions", "")
+    names = []
+    previous_end = 0
+    for match in re.finditer(r"<b>(.*?)</b>", instructions):
+        part = re.sub(r"<[^>]+>", "", match.group(1)).strip()
+        preceding = re.sub(r"<[^>]+>", "", instructions[previous_end:match.start()]).split()
+        previous_end = match.end()
+        if not part or part.lower() in DIRECTION_WORDS:
+            continue
+        word_before = preceding[-1].lower() if preceding else ""
+        if word_before in ("on", "onto"):
+            return part
+        if word_before != "toward":
+            names.append(part)
+    return names[0] if names else None
+
+def group_steps_by_road(steps):
+    """
+    Merge consecutive steps on the same road into one sub-segment of (name, distance m, duration s).
+    """
+    segments = []
+    for step in steps:
+        name = step_road_name(step)
+        distance = step["distance"]["value"]
+        duration = step["duration"]["value"]
+        if segments and name and segments[-1][0] == name:
+            previous = segments[-1]
+            segments[-1] = (name, previous[1] + distance, previous[2] + duration)
+        else:
+            segments.append((name, distance, duration))
+    return segments
+
+async def fetch_traffic_cards(origin: str, destination: str):
     url = "https://maps.googleapis.com/maps/api/directions/json"
     params = {
         "origin": origin,
@@ -298,40 +824,61 @@ def get_traffic_nearby(
         "traffic_model": "best_guess",
         "key": GOOGLE_MAPS_API_KEY
     }
-    resp = requests.get(url, params=params)
+    resp = await get_http_client().get(url, params=params)
     data = resp.json()
+    # quota and key errors are raised rather than returned, so they are not cached as "no traffic"
+    if data.get("status") not in ("OK", "ZERO_RESULTS"):
+        raise HTTPException(status_code=502, detail=f"Directions request failed: {data.get('status')}")
     cards = []
     if data.get("status") == "OK":
         leg = data["routes"][0]["legs"][0]
         normal = leg["duration"]["value"]  # seconds
         with_traffic = leg.get("duration_in_traffic", leg["duration"])["value"]
-        delay = max(0, with_traffic - normal)
-        distance_km = leg["distance"]["value"] / 1000 if leg["distance"]["value"] else 0.001
-        delay_per_km = (delay / 60) / distance_km if distance_km else 0
-        if delay_per_km < 1:
-            severity = "Light"
-        elif delay_per_km < 2:
-            severity = "Medium"
-        else:
-            severity = "Heavy"
-        # Use reverse geocode for the end location of the leg
-        end_loc = leg.get("end_location")
-        if end_loc:
-            lat = end_loc["lat"]
-            lng = end_loc["lng"]
-            place = reverse_geocode(lat, lng)
-        else:
-            place = "Unknown location"
-        cards.append({
-            "severity": severity,
-            "lastUpdated": "just now",
-            "place": place,
-            "delay": round(delay / 60),
-            "distance_km": round(distance_km, 2),
-            "delay_per_km": round(delay_per_km, 2)
-        })
+        # Google only reports traffic for the whole leg, so congestion cannot be told apart per road:
+        # every card shares the leg's severity and delay per km, and gets its share of the leg's delay
+        traffic_factor = max(1.0, with_traffic / normal) if normal else 1.0
+        leg_km = max(leg["distance"]["value"], 1) / 1000
+        leg_delay_per_km = (max(0, with_traffic - normal) / 60) / leg_km
+        severity = traffic_severity(leg_delay_per_km)
+        fallback_place = (leg.get("end_address") or "Unknown location").split(",")[0]
+
+        for name, distance_m, duration in group_steps_by_road(leg.get("steps", [])):
+            if distance_m < MIN_TRAFFIC_SEGMENT_M:
+                continue
+            # time lost to traffic over Google's typical time, so no traffic means no delay
+            delay = duration * (traffic_factor - 1)
+            cards.append({
+                "severity": severity,
+                "lastUpdated": "just now",
+                "place": name or fallback_place,
+                "delay": round(delay / 60),
+                "distance_km": round(distance_m / 1000, 2),
+                "delay_per_km": round(leg_delay_per_km, 2),
+                "traffic_scope": "leg"
+            })
+        # the stretches losing the most minutes first
+        cards.sort(key=lambda card: (card["delay"], card["distance_km"]), reverse=True)
+        cards = cards[:MAX_TRAFFIC_CARDS]
     return cards
 
+@router.get("/api/traffic-nearby", response_model=List[TrafficCard])
+async def get_traffic_nearby(
+    origin: str = Query(..., description="lat,lng"),
+    destination: str = Query(..., description="lat,lng")
+):
+    """
+    Up to five cards for the road stretches of the route that lose the most
+    minutes to traffic. Traffic is only known for the whole route, so every
+    card carries the route's severity and delay per km (traffic_scope "leg").
+    """
+    origin = snap_coordinate(origin)
+    destination = snap_coordinate(destination)
+    # identical requests within the TTL, or while one is in flight, share one upstream call
+    return await traffic_cards_cache.get_or_load(
+        (origin, destination),
+        lambda: fetch_traffic_cards(origin, destination)
+    )
+
 @router.get("/health")
 async def health_check():
     """
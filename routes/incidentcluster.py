@@ -0,0 +1,110 @@
+from collections import Counter, OrderedDict
+from math import atan, cos, degrees, floor, log, pi, radians, sinh, tan
+
+MAX_ZOOM = 20
+CLUSTER_GRID = 4  # each tile is split into CLUSTER_GRID x CLUSTER_GRID cluster cells
+MAX_CACHED_TILES = 4096  # least recently used tiles are dropped beyond this
+MAX_LAT = 85.05112878  # web mercator limit
+
+
+def tile_position(lat, lng, zoom):
+    """
+    Fractional slippy map tile coordinates of a point.
+    """
+    lat = max(min(lat, MAX_LAT), -MAX_LAT)
+    n = 2 ** zoom
+    x = (lng + 180.0) / 360.0 * n
+    y = (1.0 - log(tan(radians(lat)) + 1 / cos(radians(lat))) / pi) / 2.0 * n
+    return min(max(x, 0.0), n - 1e-9), min(max(y, 0.0), n - 1e-9)
+
+
+def tile_bounds(zoom, x, y):
+    """
+    (south, west, north, east) of a slippy map tile.
+    """
+    n = 2 ** zoom
+
+    def lat_at(tile_y):
+        return degrees(atan(sinh(pi * (1 - 2 * tile_y / n))))
+
+    return lat_at(y + 1), x / n * 360.0 - 180.0, lat_at(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tiles_in_bbox(south, west, north, east, zoom, max_tiles=None):
+    """
+    (x, y) of every tile the bbox touches. Raises ValueError, before listing
+    any, if there are more than max_tiles.
+    """
+    min_x, min_y = tile_position(north, west, zoom)
+    max_x, max_y = tile_position(south, east, zoom)
+    count = max(0, floor(max_x) - floor(min_x) + 1) * max(0, floor(max_y) - floor(min_y) + 1)
+    if max_tiles is not None and count > max_tiles:
+        raise ValueError(f"Bounding box covers {count} tiles at this zoom level, at most {max_tiles}")
+    return [
+        (x, y)
+        for x in range(floor(min_x), floor(max_x) + 1)
+        for y in range(floor(min_y), floor(max_y) + 1)
+    ]
+
+
+class TileClusterCache:
+    """
+    Grid clusters of the active incidents per slippy map tile.
+    Each tile is computed once from the incident grid index and cached until
+    an incident inside it changes, or until it is among the least recently
+    used beyond max_tiles. Empty tiles are cheap to rebuild and not cached.
+    """
+
+    def __init__(self, index, max_tiles=MAX_CACHED_TILES):
+        self.index = index
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()  # (zoom, x, y) -> list of clusters, least recently used first
+
+    def invalidate(self, lat, lng):
+        """
+        Drop the cached tile containing the point at every zoom level.
+        """
+        if not self.tiles:
+            return
+        for zoom in range(MAX_ZOOM + 1):
+            x, y = tile_position(lat, lng, zoom)
+            self.tiles.pop((zoom, floor(x), floor(y)), None)
+
+    def clear(self):
+        self.tiles.clear()
+
+    def clusters(self, zoom, x, y):
+        key = (zoom, x, y)
+        cached = self.tiles.get(key)
+        if cached is not None:
+            self.tiles.move_to_end(key)
+            return cached
+        clusters = self._build(zoom, x, y)
+        if clusters:
+            self.tiles[key] = clusters
+            if len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        return clusters
+
+    def _build(self, zoom, x, y):
+        cells = {}
+        for incident in self.index.query_bbox(*tile_bounds(zoom, x, y)):
+            tile_x, tile_y = tile_position(incident["lat"], incident["lng"], zoom)
+            # points on the tile edge belong to the neighbouring tile
+            if floor(tile_x) != x or floor(tile_y) != y:
+                continue
+            cell = (floor((tile_x - x) * CLUSTER_GRID), floor((tile_y - y) * CLUSTER_GRID))
+            cells.setdefault(cell, []).append(incident)
+
+        clusters = []
+        for members in cells.values():
+            count = len(members)
+            clusters.append({
+                "lat": sum(incident["lat"] for incident in members) / count,
+                "lng": sum(incident["lng"] for incident in members) / count,
+                "count": count,
+                "dominant_type": Counter(incident["incident_type"] for incident in members).most_common(1)[0][0],
+                "total_delay_minutes": sum(incident["delay_minutes"] or 0 for incident in members),
+                "incident_id": members[0]["incident_id"] if count == 1 else None,
+            })
+        return clusters
@@ -0,0 +1,92 @@
+from collections import deque
+
+
+def merge_changes(changes):
+    """
+    Collapse a sequence of {"added", "updated", "removed"} changes into one,
+    keeping only the latest state of each incident.
+    Returns (added, updated, removed).
+    """
+    upserts = {}  # incident_id -> ("added" | "updated", incident)
+    removed = {}
+    for change in changes:
+        for kind in ("added", "updated"):
+            for incident in change[kind]:
+                incident_id = incident["incident_id"]
+                previous = upserts.get(incident_id)
+                upserts[incident_id] = (previous[0] if previous else kind, incident)
+                removed.pop(incident_id, None)
+        for incident_id in change["removed"]:
+            upserts.pop(incident_id, None)
+            removed[incident_id] = True
+    return (
+        [incident for kind, incident in upserts.values() if kind == "added"],
+        [incident for kind, incident in upserts.values() if kind == "updated"],
+        list(removed),
+    )
+
+
+class IncidentFeed:
+    """
+    Monotonically versioned change log of the active incident set.
+    Every change bumps the version, and the most recent deltas are kept so a
+    client that missed a few can catch up without a full snapshot.
+    Changes can also be staged and flushed later as a single version, which
+    lets a burst of reports go out as one delta.
+    """
+
+    def __init__(self, history=256):
+        self.version = 0
+        self.history = deque(maxlen=history)
+        self.pending = []
+
+    def record(self, added=(), updated=(), removed=()):
+        """
+        Store a change and return the delta message clients receive for it.
+        "since" is the version the delta applies on top of, so a client whose
+        version differs knows it missed something and must resync.
+        """
+        self.version += 1
+        delta = {
+            "type": "delta",
+            "version": self.version,
+            "since": self.version - 1,
+            "added": list(added),
+            "updated": list(updated),
+            "removed": list(removed),
+        }
+        self.history.append(delta)
+        return delta
+
+    def stage(self, added=(), updated=(), removed=()):
+        self.pending.append({"added": list(added), "updated": list(updated), "removed": list(removed)})
+
+    def flush(self):
+        """
+        Record every staged change as one delta. Returns None if nothing was staged.
+        """
+        if not self.pending:
+            return None
+        added, updated, removed = merge_changes(self.pending)
+        self.pending = []
+        return self.record(added, updated, removed)
+
+    def since(self, version):
+        """
+        Merge every delta after `version` into one message.
+        Returns None when the history no longer reaches back that far.
+        """
+        if version == self.version:
+            return {"type": "delta", "version": self.version, "since": version, "added": [], "updated": [], "removed": []}
+        if version > self.version or not self.history or self.history[0]["since"] > version:
+            return None
+
+        added, updated, removed = merge_changes(delta for delta in self.history if delta["version"] > version)
+        return {
+            "type": "delta",
+            "version": self.version,
+            "since": version,
+            "added": added,
+            "updated": updated,
+            "removed": removed,
+        }
@@ -1,69 +1,485 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect,HTTPException, status
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect,HTTPException, status, Query
 from .auth import verify_token
+from .socketauth import socket_identity, session_is_current, reauthenticate, reject_expired, schedule_token_refresh, cancel_token_refresh
+import asyncio
+import itertools
 import json
+import time
 from database import user_collection
+from config import LOCATION_AOI_RADIUS_M, LOCATION_TICK_HZ, LOCATION_TRAIL_POINTS, CHAT_REGION_PRECISION
+from .spatialgrid import SpatialGrid, within_radius
+from .binaryframes import encode_location_peers
+from .sessions import ConnectionRegistry, LocationSession
+from .trail import LocationTrail
+from .geohash import encode_geohash
+from .pubsub import broadcast_backend
+from .outbox import Outbox, evict_socket, outbox_stats
 
 router = APIRouter()
-location_users = []
+location_users = ConnectionRegistry()  # LocationSession per connected socket
+# sessions with a known position, keyed by websocket, for area-of-interest queries
+location_grid = SpatialGrid(cell_size_deg=0.05)
+# state for the tick loop, which sends every client at most one frame per tick
+location_dirty = set()  # websockets whose position or icon changed since the last tick
+location_departed = []  # (username, lat, lng as of the last tick) of connections closed since the last tick
+# clients refer to peers by a small index, which keeps usernames private and binary frames small
+location_peer_ids = {}  # username -> index, released once the user has left every client's view
+location_next_peer_id = itertools.count(1)
+location_peer_json = {}  # id(peer data) -> (peer data, its JSON) for the frames of the current tick
+# users on other workers, kept in the grid under a (worker, username) key so the tick treats them as peers
+location_remote = {}  # (worker, username) -> LocationSession without a socket
+location_remote_names = {}  # username -> number of workers it is on
+location_workers = {}  # worker id -> loop time it was last heard from
+location_left = []  # local users whose last positioned session closed since the last tick
+location_full_sync = False  # a new worker appeared and needs every local position
+LOCATION_TICK_CHUNK = 100  # movers, then frames, the tick handles between yields to the event loop
+LOCATION_HEARTBEAT_S = 10  # workers publish at least this often, and are dropped after 3 silent periods
+# geohash region of every user with a known position, here or on another worker
+location_regions = {}  # username -> geohash of CHAT_REGION_PRECISION characters
+region_listeners = []  # called with (username, region) when a user moves into another region
+
 @router.websocket("/ws/location")
 async def websocket_location(websocket: WebSocket):
     await websocket.accept()
+    session = None
     try:
         raw_message = await websocket.receive_text()
         auth_message = json.loads(raw_message)  # Parse JSON message
         if auth_message.get("type") == "auth":
-            token = auth_message.get("token")
-            if token[:5] == 'Guest':
-                username = token
-            else:
-                username = verify_token(token)
+            # the token is verified here once; later messages are trusted to come from this user
+            username, expires_at, user_type = socket_identity(auth_message.get("token"))
             user = await user_collection.find_one({"username": username})
             profile_picture = user["profilePicture"] if user and "profilePicture" in user else "default_avatar.png"
-            location_users.append([username, websocket, profile_picture, 0, 0])  # username, websocket, icon, latitude, longitude
+            # {"type": "auth", "token": ..., "format": "binary"} opts in to packed peer frames
+            session = location_users.add(LocationSession(
+                username, websocket, profile_picture, binary=auth_message.get("format") == "binary",
+                expires_at=expires_at, user_type=user_type
+            ))
+            # only the newest positions matter: a client that falls behind gets one merged frame
+            session.outbox = Outbox(
+                lambda frame, session=session: send_location_frame(session, frame), "location",
+                policy="latest", merge=merge_location_frames,
+                on_evict=evict_socket(websocket, disconnect_location_user)
+            )
+            schedule_token_refresh(session)
+            peer_index(username)
             print(f"User {username} connected to location WebSocket.")
         while True:
             raw_message = await websocket.receive_text()
             message = json.loads(raw_message)  # Parse JSON message
-            print(f"locaion update{message}")
-            if message.get("type") == "location_update":
-                await broadcast_location_update(message)
+            if session is None:
+                continue
+            if message.get("type") == "auth":
+                reauthenticate(session, message.get("token"))
+            elif not session_is_current(session):
+                reject_expired(session)
+            elif message.get("type") == "location_update":
+                await broadcast_location_update(session, message)
 
     except WebSocketDisconnect:
-        for users in location_users:
-            if users[1] == websocket:
-                location_users.remove(users)
-                break
+        pass
+    finally:
+        disconnect_location_user(websocket)
 
 
-async def broadcast_location_update(new_message: dict):
-    if new_message.get("token")[0:5] == 'Guest':
-        username = new_message.get("token")
-    else:
-        username = verify_token(new_message.get("token"))
+def disconnect_location_user(websocket):
+    session = location_users.remove(websocket)
+    if session is not None:
+        cancel_token_refresh(session)
+        if session.outbox is not None:
+            session.outbox.close()
+    positioned = location_grid.remove(websocket)
+    if positioned is not None:
+        # receivers saw the position of the last tick, whatever the user reported since
+        if positioned.tick_position is not None:
+            location_departed.append((positioned.username, *positioned.tick_position))
+        if not any(other.websocket in location_grid for other in location_users.sessions_for(positioned.username)):
+            location_left.append(positioned.username)
+    elif session is not None:
+        # never shared a position from this socket, so only the user's other sockets can hold the index
+        release_peer_index(session.username)
+    location_dirty.discard(websocket)
+    if session is not None:
+        forget_region(session.username)
+
+
+def positioned_sessions(username):
+    """
+    The user's sessions still in the grid: local tabs and the copies of other workers.
+    """
+    sessions = [session for session in location_users.sessions_for(username) if session.websocket in location_grid]
+    sessions += [location_remote[(worker, username)] for worker in location_workers if (worker, username) in location_remote]
+    return sessions
+
+
+def peer_index(username):
+    index = location_peer_ids.get(username)
+    if index is None:
+        index = location_peer_ids[username] = next(location_next_peer_id)
+    return index
+
+
+def release_peer_index(username):
+    # a departure still waiting for the tick carries the index in its removal, and
+    # a user back under a new index would leave the old marker on clients' maps
+    if (
+        not location_users.is_online(username) and username not in location_remote_names
+        and all(name != username for name, lat, lng in location_departed)
+    ):
+        location_peer_ids.pop(username, None)
+
+
+def peer_data(session):
+    # peers are told apart by their index, so usernames never reach nearby strangers
+    return {
+        "id": peer_index(session.username),
+        "icon": session.icon,
+        "lat": session.lat,
+        "lng": session.lng
+    }
+
+
+async def broadcast_location_update(sender, new_message: dict):
+    """
+    Record the latest position of the sender's user. Nothing is sent here: the tick loop
+    coalesces all updates since the previous tick into one frame per client.
+    """
     location = new_message.get("location")
 
-    # Update the user's location in the `location_users` list
-    for connection in location_users:
-        if username == connection[0]:
-            connection[3] = location["lat"]
-            connection[4] = location["lng"]
-
-    # Precompute the data for all users
-    all_users_data = [
-        {
-            "icon": user[2],
-            "lat": user[3],
-            "lng": user[4]
-        }
-        for user in location_users
-    ]
-
-    # Send personalized data to each user
-    for connection in location_users[:]:  # Iterate over a copy of the list
+    # the reporting socket keeps the trail, the user's other tabs only mirror the position
+    if sender.trail is None:
+        sender.trail = LocationTrail(LOCATION_TRAIL_POINTS)
+    sender.trail.append(time.time(), location["lat"], location["lng"])
+
+    # Update the user's sessions and their place in the grid
+    for session in location_users.sessions_for(sender.username):
+        session.lat = location["lat"]
+        session.lng = location["lng"]
+        location_grid.add(session.websocket, session.lat, session.lng, session)
+        location_dirty.add(session.websocket)
+    update_region(sender.username, location["lat"], location["lng"])
+
+
+def update_region(username, lat, lng):
+    region = encode_geohash(lat, lng, CHAT_REGION_PRECISION)
+    if location_regions.get(username) != region:
+        location_regions[username] = region
+        for listener in region_listeners:
+            listener(username, region)
+
+
+def forget_region(username):
+    # chat sessions keep the last region they were given, this only drops users no longer sharing a position
+    if not location_users.is_online(username) and username not in location_remote_names:
+        location_regions.pop(username, None)
+
+
+async def build_location_frames():
+    """
+    Work out what changed for each client since the last tick.
+    Returns {websocket: {"updated": {username: peer}, "removed": {username: peer index}}}.
+    Indexes are looked up now, as a departed user's index is released before queued frames are sent.
+    Yields to the event loop every LOCATION_TICK_CHUNK movers. Positions are taken
+    from a snapshot of the grid, so every client sees a peer where its tick_position
+    says; anything that changes meanwhile is marked dirty again and goes out with the next tick.
+    """
+    changed = [location_grid.get(websocket) for websocket in location_dirty]
+    changed = [session for session in changed if session is not None]
+    departed = list(location_departed)
+    location_dirty.clear()
+    location_departed.clear()
+    moves = [(session, session.tick_position) for session in changed]
+    moved = {}  # websocket -> peer data of every session that moved, built once per tick
+    for session in changed:
+        session.tick_position = (session.lat, session.lng)
+        moved[session.websocket] = peer_data(session)
+    grid = location_grid.copy() if len(changed) >= LOCATION_TICK_CHUNK else location_grid
+    # movers work out their own view, and remote users are shown by their own worker
+    not_receiving = moved.keys() | location_remote.keys()
+
+    frames = {}
+    def frame_for(websocket):
+        frame = frames.get(websocket)
+        if frame is None:
+            frame = frames[websocket] = {"updated": {}, "removed": {}}
+        return frame
+
+    for count, (session, old_position) in enumerate(moves, 1):
+        if count % LOCATION_TICK_CHUNK == 0:
+            await asyncio.sleep(0)
+        name = session.username
+        position = session.tick_position
+        # within_radius is symmetric, so one query answers both directions
+        near, far = grid.split_radius(*position, LOCATION_AOI_RADIUS_M)
+
+        # A client that moved re-evaluates its whole area of interest, and clients
+        # that stayed put hear about the peers that moved into or within range
+        receiving = session.websocket not in location_remote
+        if receiving:
+            previously = session.visible
+            in_range = {}
+            frame = frame_for(session.websocket)
+            updated = frame["updated"]
+        data = moved[session.websocket]
+        for peer in near:
+            peer_name = peer.username
+            if peer_name == name:
+                continue
+            if receiving:
+                in_range[peer_name] = peer
+                peer_moved = moved.get(peer.websocket)
+                if peer_moved is not None:
+                    updated[peer_name] = peer_moved
+                elif peer_name not in previously:
+                    updated[peer_name] = peer_data(peer)
+            if peer.websocket not in not_receiving:
+                peer.visible.add(name)
+                frame_for(peer.websocket)["updated"][name] = data
+        if receiving:
+            removed = frame["removed"]
+            for peer_name in previously - in_range.keys():
+                removed[peer_name] = location_peer_ids.get(peer_name)
+            session.visible = set(in_range)
+
+        # and the ones it moved out of range of lose it
+        if old_position is None:
+            continue
+        if grid.cell_window(*old_position, LOCATION_AOI_RADIUS_M) == grid.cell_window(*position, LOCATION_AOI_RADIUS_M):
+            # the same cells, so whoever saw the old position and is out of range now is in far
+            out_of_range = far
+        else:
+            out_of_range = grid.split_radius(*old_position, LOCATION_AOI_RADIUS_M)[0]
+        for receiver in out_of_range:
+            if name not in receiver.visible or receiver.websocket in not_receiving:
+                continue
+            frame = frames.get(receiver.websocket)
+            if frame is None or name not in frame["updated"]:
+                receiver.visible.discard(name)
+                frame_for(receiver.websocket)["removed"][name] = location_peer_ids.get(name)
+
+    # Disconnected users disappear from the clients that were showing them,
+    # unless another tab or worker still puts the user in their range
+    for name, lat, lng in departed:
+        remaining = [session.tick_position for session in positioned_sessions(name) if session.tick_position is not None]
+        for receiver in grid.split_radius(lat, lng, LOCATION_AOI_RADIUS_M)[0]:
+            if name in receiver.visible and not any(
+                within_radius(*receiver.tick_position, *position, LOCATION_AOI_RADIUS_M) for position in remaining
+            ):
+                receiver.visible.discard(name)
+                frame_for(receiver.websocket)["removed"][name] = location_peer_ids.get(name)
+                frame_for(receiver.websocket)["updated"].pop(name, None)
+
+    return frames
+
+
+def merge_location_frames(pending, frame):
+    """
+    Fold a newer frame into one still waiting in a client's outbox.
+    """
+    for name, index in frame["removed"].items():
+        pending["updated"].pop(name, None)
+        pending["removed"][name] = index
+    for name, peer in frame["updated"].items():
+        # a user who left and came back under a new index still needs the old one removed
+        if name in pending["removed"] and pending["removed"][name] == location_peer_ids.get(name):
+            del pending["removed"][name]
+        pending["updated"][name] = peer
+    return pending
+
+
+def peer_json(peer):
+    # keyed by identity, and the peer is kept alongside so its id cannot be reused while cached
+    cached = location_peer_json.get(id(peer))
+    if cached is None or cached[0] is not peer:
+        cached = location_peer_json[id(peer)] = (peer, json.dumps(peer, separators=(",", ":"), ensure_ascii=False))
+    return cached[1]
+
+
+async def send_location_frame(session, frame):
+    """
+    Called by the session's outbox writer; a failure evicts the client.
+    Auth frames from socketauth are queued as JSON text and sent as is.
+
+    JSON clients get {"type": "peers", "updated": [{"id", "icon", "lat", "lng"}],
+    "removed": [id]}, listing only what changed since their last frame. Binary
+    clients get the packed equivalent from encode_location_peers, after a
+    {"type": "peer_dict", "peers": [{"index", "icon"}]} frame for any index
+    they have not seen yet. Either way a peer's id is an opaque index, never its username.
+    """
+    websocket = session.websocket
+    if isinstance(frame, str):
+        await websocket.send_text(frame)
+        return
+    known = session.known_peers
+    if known is None:
+        updated = list(frame["updated"].values())
+        ids = {peer["id"] for peer in updated}
+        removed = [index for index in frame["removed"].values() if index is not None and index not in ids]
+        # the same as send_json, but each peer is encoded once per tick rather than once per client
+        await websocket.send_text(
+            '{"type":"peers","updated":[%s],"removed":%s}' % (",".join(map(peer_json, updated)), json.dumps(removed))
+        )
+        return
+
+    # binary clients first learn the avatar behind any new index, as one JSON frame
+    updated = []
+    dictionary = []
+    for peer in frame["updated"].values():
+        index = peer["id"]
+        if known.get(index) != peer["icon"]:
+            known[index] = peer["icon"]
+            dictionary.append({"index": index, "icon": peer["icon"]})
+        updated.append((index, peer["lat"], peer["lng"]))
+    removed = []
+    for index in frame["removed"].values():
+        if index is not None:
+            known.pop(index, None)
+            removed.append(index)
+    if dictionary:
+        await websocket.send_json({"type": "peer_dict", "peers": dictionary})
+    await websocket.send_bytes(encode_location_peers(updated, removed))
+
+
+async def location_tick(heartbeat=False):
+    location_peer_json.clear()
+    departed = [name for name, lat, lng in location_departed]
+    await publish_location_changes(heartbeat)
+    # frames are only queued here, each client's writer sends them at its own pace;
+    # yielding now and then lets those writers start instead of all waking at once
+    for count, (websocket, frame) in enumerate((await build_location_frames()).items(), 1):
+        if count % LOCATION_TICK_CHUNK == 0:
+            await asyncio.sleep(0)
+        if frame["updated"] or frame["removed"]:
+            session = location_users.get(websocket)
+            if session is not None:
+                session.outbox.put(frame)
+    # queued frames carry the indexes of these users, so the indexes can go
+    for name in departed:
+        release_peer_index(name)
+
+
+async def publish_location_changes(heartbeat=False):
+    """
+    Send the other workers the local users that moved or left since the last tick.
+    Once per tick, so cross-worker traffic follows the tick rate, not the GPS rates.
+    """
+    global location_full_sync
+    if location_full_sync:
+        location_full_sync = False
+        sockets = [session.websocket for session in location_users if session.websocket in location_grid]
+    else:
+        sockets = location_dirty
+    moved = {}
+    for websocket in sockets:
+        session = location_users.get(websocket)
+        if session is not None and websocket in location_grid:
+            moved[session.username] = [session.username, session.icon, session.lat, session.lng]
+    left = [name for name in location_left if not location_users.is_online(name)]
+    location_left.clear()
+    if moved or left or heartbeat:
+        await broadcast_backend.publish("location", {
+            "worker": broadcast_backend.worker_id, "moved": list(moved.values()), "left": left
+        })
+
+
+def remove_remote_peer(key):
+    peer = location_remote.pop(key, None)
+    if peer is None:
+        return
+    location_remote_names[key[1]] -= 1
+    if not location_remote_names[key[1]]:
+        del location_remote_names[key[1]]
+    if location_grid.remove(key) is not None and peer.tick_position is not None:
+        location_departed.append((peer.username, *peer.tick_position))
+    location_dirty.discard(key)
+    forget_region(peer.username)
+
+
+async def handle_remote_location(change):
+    """
+    Fold the users of another worker into the grid; the next tick sends them out.
+    """
+    global location_full_sync
+    worker = change["worker"]
+    if worker not in location_workers:
+        # a worker that just started knows nobody here yet
+        location_full_sync = True
+    location_workers[worker] = asyncio.get_running_loop().time()
+    for username, icon, lat, lng in change["moved"]:
+        key = (worker, username)
+        peer = location_remote.get(key)
+        if peer is None:
+            peer = location_remote[key] = LocationSession(username, key, icon)
+            location_remote_names[username] = location_remote_names.get(username, 0) + 1
+            peer_index(username)
+        peer.icon, peer.lat, peer.lng = icon, lat, lng
+        location_grid.add(key, lat, lng, peer)
+        location_dirty.add(key)
+        # a user's chat socket can be on this worker while their location socket is on another
+        update_region(username, lat, lng)
+    for username in change["left"]:
+        remove_remote_peer((worker, username))
+
+broadcast_backend.subscribe("location", handle_remote_location)
+
+
+def drop_silent_workers(now):
+    for worker, last_heard in list(location_workers.items()):
+        if now - last_heard > 3 * LOCATION_HEARTBEAT_S:
+            del location_workers[worker]
+            for key in [key for key in location_remote if key[0] == worker]:
+                remove_remote_peer(key)
+
+
+async def location_tick_loop():
+    """
+    Background task started with the app: send batched location frames at LOCATION_TICK_HZ.
+    """
+    interval = 1 / LOCATION_TICK_HZ
+    loop = asyncio.get_running_loop()
+    last_heartbeat = 0
+    while True:
+        started = loop.time()
         try:
-            # Exclude the current user's data
-            return_list = [data for i, data in enumerate(all_users_data) if location_users[i][0] != connection[0]]
-            await connection[1].send_json(return_list)
+            heartbeat = started - last_heartbeat >= LOCATION_HEARTBEAT_S
+            if heartbeat:
+                last_heartbeat = started
+                drop_silent_workers(started)
+            await location_tick(heartbeat)
         except Exception as e:
-            print(f"Error sending update to {connection[0]}: {e}")
-            location_users.remove(connection)
\ No newline at end of file
+            print(f"Location tick failed: {e}")
+        await asyncio.sleep(max(0, interval - (loop.time() - started)))
+
+
+@router.get("/api/location/stats")
+async def location_stats():
+    stats = location_users.stats()
+    stats["queues"] = outbox_stats("location", (session.outbox for session in location_users))
+    return stats
+
+
+@router.get("/api/location/trail/{token}")
+async def get_location_trail(
+    token: str,
+    seconds: float = Query(600, gt=0, description="How far back the trail goes"),
+    max_points: int = Query(100, ge=2, le=1000, description="Points are evenly thinned out to at most this many")
+):
+    """
+    The caller's recent positions on this server, oldest first.
+    Needs a signed-in user's JWT: guest names are sequential and shown to
+    nearby peers, so they cannot stand in for a token here.
+    """
+    username = verify_token(token)
+    trails = [session.trail for session in location_users.sessions_for(username) if session.trail is not None]
+    if not trails:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No recent locations for this user")
+    # the device that reported last
+    trail = max(trails, key=LocationTrail.latest_time)
+    points = trail.downsample(time.time() - seconds, max_points)
+    return {
+        "username": username,
+        "points": [
+            # lat/lng are stored as float32, good to about a metre
+            {"time": timestamp, "lat": round(lat, 6), "lng": round(lng, 6)} for timestamp, lat, lng in points
+        ]
+    }
@@ -4,34 +4,54 @@ import requests
 from model import userData, RouteRequest
 from config import ORS_API_KEY
 from .predict_eta import predict_from_google_routes
+from .httpclient import get_http_client
 from datetime import datetime, timedelta
 from itertools import product
 
 router = APIRouter()
 
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
+NOMINATIM_HEADERS = {
+    "User-Agent": "Roadpulse/1.0"
+}
+
+def nominatim_params(lat, lng):
+    return {
+        "lat": lat,
+        "lon": lng,
+        "format": "json",
+        "zoom": 16,
+        "addressdetails": 1
+    }
+
+def place_from_nominatim(data):
+    display_name = data.get("display_name", "Unknown location")
+    # Split by comma and find the first non-numeric part
+    for part in display_name.split(","):
+        part = part.strip()
+        if not part.isdigit():
+            return part
+    return display_name  # fallback to full address
+
 def reverse_geocode(lat, lng):
     try:
-        url = f"https://nominatim.openstreetmap.org/reverse"
-        params = {
-            "lat": lat,
-            "lon": lng,
-            "format": "json",
-            "zoom": 16,
-            "addressdetails": 1
-        }
-        headers = {
-            "User-Agent": "Roadpulse/1.0"
-        }
-        response = requests.get(url, params=params, headers=headers, timeout=5)
+        response = requests.get(NOMINATIM_URL, params=nominatim_params(lat, lng), headers=NOMINATIM_HEADERS, timeout=5)
+        if response.status_code == 200:
+            return place_from_nominatim(response.json())
+        else:
+            return "Unknown location"
+    except Exception as e:
+        print("Reverse geocoding error:", e)
+        return "Unknown location"
+
+async def reverse_geocode_async(lat, lng):
+    """
+    Same as reverse_geocode but over the shared async client, so it never blocks the event loop.
+    """
+    try:
+        response = await get_http_client().get(NOMINATIM_URL, params=nominatim_params(lat, lng), headers=NOMINATIM_HEADERS, timeout=5)
         if response.status_code == 200:
-            data = response.json()
-            display_name = data.get("display_name", "Unknown location")
-            # Split by comma and find the first non-numeric part
-            for part in display_name.split(","):
-                part = part.strip()
-                if not part.isdigit():
-                    return part
-            return display_name  # fallback to full address
+            return place_from_nominatim(response.json())
         else:
             return "Unknown location"
     except Exception as e:
@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import Counter, deque
+from config import OUTBOX_MAX_FRAMES, OUTBOX_MAX_LAG_S
+
+evictions = Counter()  # channel -> slow clients disconnected so far
+closing = set()  # keeps the close of evicted sockets alive until it finishes
+
+
+class Outbox:
+    """
+    Bounded outbound queue for one WebSocket, drained by its own writer task,
+    so a broadcast only queues frames and never waits on a slow client.
+
+    "drop_oldest" keeps frames in order and drops the oldest once max_frames
+    are waiting, for streams like chat. "latest" keeps a single pending frame;
+    a newer one replaces it, or is folded into it by `merge(pending, new)`
+    when frames are deltas, for streams like live locations.
+    Control frames such as auth replies are queued with keep=True: they keep
+    their place in line and are never dropped or merged.
+    A client whose oldest queued frame is older than max_lag seconds, or
+    whose send fails, is evicted: the queue closes and `on_evict` runs.
+    """
+
+    def __init__(self, send, channel, policy="drop_oldest", merge=None, on_evict=None,
+                 max_frames=OUTBOX_MAX_FRAMES, max_lag=OUTBOX_MAX_LAG_S):
+        if policy not in ("drop_oldest", "latest"):
+            raise ValueError(f"Unknown outbox policy: {policy}")
+        self.send = send  # async callable writing one frame to the socket
+        self.channel = channel
+        self.policy = policy
+        self.merge = merge
+        self.on_evict = on_evict
+        self.max_frames = max_frames
+        self.max_lag = max_lag
+        self.frames = deque()  # (monotonic time queued, frame, keep)
+        self.ready = asyncio.Event()
+        self.writer = None
+        self.sending_since = None  # monotonic time the send in progress started
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0  # frames dropped or folded into a newer one
+
+    def __len__(self):
+        return len(self.frames)
+
+    def lag(self, now=None):
+        """
+        Seconds the client has been behind: how long the send in progress
+        or else the oldest queued frame has been waiting.
+        """
+        oldest = self.sending_since if self.sending_since is not None else (self.frames[0][0] if self.frames else None)
+        if oldest is None:
+            return 0.0
+        return (now or time.monotonic()) - oldest
+
+    def put(self, frame, keep=False):
+        """
+        Queue a frame without waiting. Returns False if the client was evicted.
+        """
+        if self.closed:
+            return False
+        now = time.monotonic()
+        if self.lag(now) > self.max_lag:
+            self.evict(f"{self.lag(now):.1f}s behind, {len(self.frames)} frames queued")
+            return False
+        if self.policy == "latest" and not keep and self.frames and not self.frames[-1][2]:
+            queued_at, pending, _ = self.frames.pop()
+            self.frames.append((queued_at, self.merge(pending, frame) if self.merge else frame, False))
+            self.dropped += 1
+        else:
+            if not keep and len(self.frames) >= self.max_frames:
+                self.drop_oldest()
+            self.frames.append((now, frame, keep))
+        self.ready.set()
+        if self.writer is None:
+            self.writer = asyncio.create_task(self.drain())
+        return True
+
+    async def drain(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.frames:
+                    queued_at, frame, keep = self.frames.popleft()
+                    # a stuck send counts from when the frame was queued, see lag()
+                    self.sending_since = queued_at
+                    await self.send(frame)
+                    self.sending_since = None
+                    self.sent += 1
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.writer = None  # finishing on its own, nothing to cancel
+            self.evict(repr(e))
+
+    def drop_oldest(self):
+        for i, (queued_at, frame, keep) in enumerate(self.frames):
+            if not keep:
+                del self.frames[i]
+                self.dropped += 1
+                return
+
+    def evict(self, reason):
+        if self.closed:
+            return
+        evictions[self.channel] += 1
+        print(f"Disconnecting slow {self.channel} client: {reason}")
+        self.close()
+        if self.on_evict is not None:
+            self.on_evict()
+
+    def close(self):
+        """
+        Stop the writer and discard whatever is still queued.
+        """
+        self.closed = True
+        self.frames.clear()
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+
+
+async def close_socket(websocket):
+    try:
+        await websocket.close()
+    except Exception:
+        pass
+
+
+def evict_socket(websocket, cleanup=None):
+    """
+    on_evict callback: forget the connection right away, then close it in the background.
+    """
+    def on_evict():
+        if cleanup is not None:
+            cleanup(websocket)
+        task = asyncio.create_task(close_socket(websocket))
+        closing.add(task)
+        task.add_done_callback(closing.discard)
+    return on_evict
+
+
+def outbox_stats(channel, outboxes):
+    """
+    Queue depths of the given outboxes, for the stats endpoints.
+    """
+    now = time.monotonic()
+    depths = []
+    dropped = sent = 0
+    max_lag = 0.0
+    for outbox in outboxes:
+        if outbox is None:
+            continue
+        depths.append(len(outbox))
+        dropped += outbox.dropped
+        sent += outbox.sent
+        max_lag = max(max_lag, outbox.lag(now))
+    return {
+        "queued_frames": sum(depths),
+        "max_queue_depth": max(depths, default=0),
+        "max_lag_s": round(max_lag, 3),
+        "sent_frames": sent,
+        "dropped_frames": dropped,
+        "evicted_clients": evictions[channel]
+    }
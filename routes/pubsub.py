@@ -0,0 +1,232 @@
+import asyncio
+import json
+import uuid
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+from config import BROADCAST_BACKEND_URL
+
+CHANNEL_PREFIX = "roadpulse:"
+
+
+class BroadcastBackend(ABC):
+    """
+    Carries broadcast events between the workers serving the app.
+    Every worker delivers an event to its own sockets itself and publishes
+    it here; handlers only see events published by other workers.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.handlers = {}  # channel -> async handler(data)
+
+    def subscribe(self, channel, handler):
+        self.handlers[channel] = handler
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, channel, data):
+        pass
+
+    @abstractmethod
+    async def incr(self, key):
+        """
+        Atomically increment a counter shared by all workers and return the new value.
+        """
+
+    def envelope(self, data):
+        return json.dumps({"origin": self.worker_id, "data": data}, default=str)
+
+    async def dispatch(self, channel, payload):
+        message = json.loads(payload)
+        if message["origin"] == self.worker_id:
+            return
+        handler = self.handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            await handler(message["data"])
+        except Exception as e:
+            print(f"Error handling {channel} broadcast: {e!r}")
+
+
+class InProcessBackend(BroadcastBackend):
+    """
+    Backend for a single worker. Backends sharing a hub list behave like
+    workers on one bus, which is handy for trying multi-worker fan-out in one process.
+    """
+
+    def __init__(self, hub=None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+        self.counters = {}
+
+    async def publish(self, channel, data):
+        payload = self.envelope(data)
+        for backend in list(self.hub):
+            if backend is not self:
+                await backend.dispatch(channel, payload)
+
+    async def incr(self, key):
+        owner = self.hub[0]
+        owner.counters[key] = owner.counters.get(key, 0) + 1
+        return owner.counters[key]
+
+
+class RedisProtocolError(Exception):
+    pass
+
+
+def encode_command(*args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    """
+    Read one RESP reply. Errors are raised as RedisProtocolError.
+    """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise RedisProtocolError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisProtocolError(f"Unexpected reply {line!r}")
+
+
+class RedisBackend(BroadcastBackend):
+    """
+    Pub/sub over the Redis protocol, with no client library: one connection
+    for PUBLISH and INCR, and one that stays in SUBSCRIBE mode.
+    Both reconnect on their own after a failure.
+    """
+
+    def __init__(self, url, reconnect_delay=1.0):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.reconnect_delay = reconnect_delay
+        self.command_connection = None
+        self.command_lock = asyncio.Lock()
+        self.listener = None
+        self.subscribed = asyncio.Event()
+
+    async def open_connection(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await writer.drain()
+            await read_reply(reader)
+        return reader, writer
+
+    async def connect(self):
+        self.listener = asyncio.create_task(self.listen())
+        await self.subscribed.wait()
+
+    async def disconnect(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+        if self.command_connection is not None:
+            self.command_connection[1].close()
+            self.command_connection = None
+
+    async def command(self, *args):
+        async with self.command_lock:
+            for attempt in range(2):
+                try:
+                    if self.command_connection is None:
+                        reader, writer = await self.open_connection()
+                        if self.db:
+                            writer.write(encode_command("SELECT", self.db))
+                            await writer.drain()
+                            await read_reply(reader)
+                        self.command_connection = (reader, writer)
+                    reader, writer = self.command_connection
+                    writer.write(encode_command(*args))
+                    await writer.drain()
+                    return await read_reply(reader)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    self.command_connection = None
+                    if attempt:
+                        raise
+
+    async def publish(self, channel, data):
+        try:
+            await self.command("PUBLISH", CHANNEL_PREFIX + channel, self.envelope(data))
+        except Exception as e:
+            # local clients already have the event, only the other workers miss it
+            print(f"Error publishing {channel} broadcast: {e!r}")
+
+    async def incr(self, key):
+        return await self.command("INCR", CHANNEL_PREFIX + key)
+
+    async def listen(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self.open_connection()
+                channels = [CHANNEL_PREFIX + channel for channel in self.handlers]
+                writer.write(encode_command("SUBSCRIBE", *channels))
+                await writer.drain()
+                for _ in channels:
+                    await read_reply(reader)  # one confirmation per channel
+                self.subscribed.set()
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        await self.dispatch(reply[1].decode()[len(CHANNEL_PREFIX):], reply[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Broadcast backend connection lost, reconnecting: {e!r}")
+                # let connect() return so a worker still serves its own clients while Redis is down
+                self.subscribed.set()
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+
+def create_backend(url):
+    """
+    "memory://" for a single worker, "redis://[:password@]host[:port][/db]" to share broadcasts across workers.
+    """
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return InProcessBackend()
+    if scheme == "redis":
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported broadcast backend: {url}")
+
+
+# the backend every router publishes to, connected on app startup
+broadcast_backend = create_backend(BROADCAST_BACKEND_URL)
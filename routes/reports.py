@@ -2,20 +2,23 @@
 from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime
 from bson import ObjectId
-from database import incident_report_collection
+from database import incident_report_collection, incident_archive_collection
 from .admin import verify_admin_token
+from .incident import count_all_incidents
 
 router = APIRouter()
 
 @router.get("/reports/incidents/total")
 async def get_total_incident_reports():
-    count = await incident_report_collection.count_documents({})
+    count = await count_all_incidents()
     return {"total_reports": count}
 
 @router.get("/reports/incidents/daily")
 async def get_daily_incident_reports(current_admin: str = Depends(verify_admin_token)):
     try:
         pipeline = [
+            # archived incidents still count towards the daily totals
+            {"$unionWith": {"coll": incident_archive_collection.name}},
             {
                 "$group": {
                     "_id": {
@@ -0,0 +1,121 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = 111320
+MAX_ROUTE_PIECES = 100_000  # about 20,000 km of route at the default 100 m threshold
+
+
+def route_bounding_box(coordinates, threshold_m):
+    """
+    Bounding box of a [lat, lng] route padded by threshold_m on every side.
+    Returns (south, west, north, east).
+    """
+    route = np.asarray(coordinates, dtype=float)
+    pad_lat = threshold_m / METERS_PER_DEGREE
+    max_abs_lat = min(np.abs(route[:, 0]).max() + pad_lat, 89.0)
+    pad_lng = threshold_m / (METERS_PER_DEGREE * np.cos(np.radians(max_abs_lat)))
+    return (
+        route[:, 0].min() - pad_lat,
+        route[:, 1].min() - pad_lng,
+        route[:, 0].max() + pad_lat,
+        route[:, 1].max() + pad_lng,
+    )
+
+
+def distances_to_route(coordinates, incident_lats, incident_lngs, threshold_m=100, max_pieces=MAX_ROUTE_PIECES):
+    """
+    Distance in meters from every incident to the closest segment of the route.
+
+    Segments are split into pieces at most one cell long and bucketed into a
+    grid of cells padded by threshold_m, so only incident/piece pairs that
+    share a cell are measured and the grid grows linearly with route length.
+    Incidents with no segment within reach get inf. Distances are computed
+    with a local equirectangular projection at each piece start, which is
+    accurate to well under a meter at the threshold distances used here.
+    Raises ValueError for non-finite coordinates or a route needing more
+    than max_pieces pieces.
+    """
+    route = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    inc_lat = np.asarray(incident_lats, dtype=float)
+    inc_lng = np.asarray(incident_lngs, dtype=float)
+    result = np.full(inc_lat.shape[0], np.inf)
+    if route.shape[0] == 0 or inc_lat.shape[0] == 0:
+        return result
+    if not np.isfinite(route).all():
+        raise ValueError("Route coordinates must be finite numbers")
+    if route.shape[0] == 1:
+        route = np.vstack([route, route])  # a single point is a zero length segment
+
+    # Cell size and padding in degrees, conservative for the highest latitude on the route
+    pad_lat = threshold_m / METERS_PER_DEGREE
+    max_abs_lat = min(np.abs(route[:, 0]).max() + pad_lat, 89.0)
+    pad_lng = threshold_m / (METERS_PER_DEGREE * np.cos(np.radians(max_abs_lat)))
+    cell = 2 * max(pad_lat, pad_lng)
+
+    # Split every segment into pieces no longer than a cell along either axis,
+    # so each padded piece covers a handful of cells however long the segment
+    start_lat, start_lng = route[:-1, 0], route[:-1, 1]
+    d_lat, d_lng = route[1:, 0] - start_lat, route[1:, 1] - start_lng
+    pieces = np.maximum(np.ceil(np.maximum(np.abs(d_lat), np.abs(d_lng)) / cell), 1)
+    if pieces.sum() > max_pieces:
+        raise ValueError(f"Route too long: needs {int(pieces.sum())} pieces, at most {max_pieces}")
+    pieces = pieces.astype(np.int64)
+    seg_of_piece = np.repeat(np.arange(pieces.shape[0]), pieces)
+    step = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    t0 = step / pieces[seg_of_piece]
+    t1 = (step + 1) / pieces[seg_of_piece]
+    a_lat = start_lat[seg_of_piece] + t0 * d_lat[seg_of_piece]
+    a_lng = start_lng[seg_of_piece] + t0 * d_lng[seg_of_piece]
+    b_lat = start_lat[seg_of_piece] + t1 * d_lat[seg_of_piece]
+    b_lng = start_lng[seg_of_piece] + t1 * d_lng[seg_of_piece]
+
+    # Cells covered by each padded piece bounding box
+    row0 = np.floor((np.minimum(a_lat, b_lat) - pad_lat) / cell).astype(np.int64)
+    row1 = np.floor((np.maximum(a_lat, b_lat) + pad_lat) / cell).astype(np.int64)
+    col0 = np.floor((np.minimum(a_lng, b_lng) - pad_lng) / cell).astype(np.int64)
+    col1 = np.floor((np.maximum(a_lng, b_lng) + pad_lng) / cell).astype(np.int64)
+    n_cols = col1 - col0 + 1
+    counts = (row1 - row0 + 1) * n_cols
+
+    seg_of_entry = np.repeat(np.arange(counts.shape[0]), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    entry_rows = row0[seg_of_entry] + offset // n_cols[seg_of_entry]
+    entry_cols = col0[seg_of_entry] + offset % n_cols[seg_of_entry]
+    entry_keys = (entry_rows << 32) + entry_cols
+    order = np.argsort(entry_keys, kind="stable")
+    entry_keys = entry_keys[order]
+    seg_of_entry = seg_of_entry[order]
+
+    # Pair every incident with the pieces registered in its cell
+    inc_keys = (np.floor(inc_lat / cell).astype(np.int64) << 32) + np.floor(inc_lng / cell).astype(np.int64)
+    lo = np.searchsorted(entry_keys, inc_keys, side="left")
+    hi = np.searchsorted(entry_keys, inc_keys, side="right")
+    per_incident = hi - lo
+    if per_incident.sum() == 0:
+        return result
+    pair_inc = np.repeat(np.arange(inc_lat.shape[0]), per_incident)
+    pair_pos = np.arange(per_incident.sum()) - np.repeat(np.cumsum(per_incident) - per_incident, per_incident)
+    pair_seg = seg_of_entry[np.repeat(lo, per_incident) + pair_pos]
+
+    # Point to segment distance in a local projection anchored at the piece start
+    seg_a_lat = a_lat[pair_seg]
+    seg_a_lng = a_lng[pair_seg]
+    scale_y = np.radians(1.0) * EARTH_RADIUS_M
+    scale_x = scale_y * np.cos(np.radians(seg_a_lat))
+    bx = (b_lng[pair_seg] - seg_a_lng) * scale_x
+    by = (b_lat[pair_seg] - seg_a_lat) * scale_y
+    px = (inc_lng[pair_inc] - seg_a_lng) * scale_x
+    py = (inc_lat[pair_inc] - seg_a_lat) * scale_y
+    seg_len_sq = bx * bx + by * by
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(seg_len_sq > 0, (px * bx + py * by) / seg_len_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    dx = px - t * bx
+    dy = py - t * by
+    pair_dist = np.sqrt(dx * dx + dy * dy)
+
+    # pair_inc is sorted, so each incident's pairs form one contiguous run
+    has_pairs = per_incident > 0
+    starts = (np.cumsum(per_incident) - per_incident)[has_pairs]
+    result[has_pairs] = np.minimum.reduceat(pair_dist, starts)
+    return result
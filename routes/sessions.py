@@ -0,0 +1,129 @@
+import sys
+from .trail import LocationTrail
+
+
+class SocketSession:
+    """
+    One authenticated WebSocket. The identity is verified once, when the
+    socket sends its auth frame, and only checked again once it expires.
+    """
+    __slots__ = ("username", "websocket", "expires_at", "user_type", "refresh_handle", "outbox")
+
+    def __init__(self, username, websocket, expires_at=None, user_type=None):
+        self.username = username
+        self.websocket = websocket
+        self.expires_at = expires_at  # unix time the token stops being valid, None for guests
+        self.user_type = user_type
+        self.refresh_handle = None  # timer that pushes a fresh token before expiry
+        self.outbox = None  # Outbox the socket's writer task drains, set once authenticated
+
+
+class LocationSession(SocketSession):
+    """
+    One live location WebSocket and everything the tick loop tracks for it.
+    """
+    __slots__ = ("icon", "lat", "lng", "visible", "tick_position", "known_peers", "trail")
+
+    def __init__(self, username, websocket, icon, binary=False, expires_at=None, user_type=None):
+        super().__init__(username, websocket, expires_at, user_type)
+        self.icon = icon
+        self.lat = 0
+        self.lng = 0
+        self.visible = set()  # usernames of the peers this client currently shows
+        self.tick_position = None  # (lat, lng) as of the last tick
+        # binary clients only: {peer index: icon} dictionary entries already sent
+        self.known_peers = {} if binary else None
+        self.trail = None  # LocationTrail of the positions this socket reported, from its first update
+
+
+class ChatSession(SocketSession):
+    """
+    One chat WebSocket and the channels it is in.
+    """
+    __slots__ = ("region", "in_global")
+
+    def __init__(self, username, websocket, expires_at=None, user_type=None):
+        super().__init__(username, websocket, expires_at, user_type)
+        self.region = None  # geohash of the user's live location, None until they share one
+        self.in_global = True
+
+
+class ConnectionRegistry:
+    """
+    Sessions indexed by websocket and by username, so finding, adding and
+    removing a connection costs the same however many users are online.
+    A user can have several sessions open, e.g. one per browser tab.
+    """
+
+    def __init__(self):
+        self.by_socket = {}  # websocket -> session
+        self.by_username = {}  # username -> {websocket: session}, in connection order
+
+    def __len__(self):
+        return len(self.by_socket)
+
+    def __iter__(self):
+        # a copy, so sessions can be removed while a broadcast walks the registry
+        return iter(list(self.by_socket.values()))
+
+    def __contains__(self, websocket):
+        return websocket in self.by_socket
+
+    def add(self, session):
+        self.remove(session.websocket)
+        self.by_socket[session.websocket] = session
+        self.by_username.setdefault(session.username, {})[session.websocket] = session
+        return session
+
+    def remove(self, websocket):
+        session = self.by_socket.pop(websocket, None)
+        if session is None:
+            return None
+        sessions = self.by_username.get(session.username)
+        if sessions is not None:
+            sessions.pop(websocket, None)
+            if not sessions:
+                del self.by_username[session.username]
+        return session
+
+    def get(self, websocket):
+        return self.by_socket.get(websocket)
+
+    def sessions_for(self, username):
+        return list(self.by_username.get(username, {}).values())
+
+    def first(self, username):
+        """
+        The user's longest open session, or None when they are offline.
+        """
+        sessions = self.by_username.get(username)
+        return next(iter(sessions.values())) if sessions else None
+
+    def is_online(self, username):
+        return username in self.by_username
+
+    def clear(self):
+        self.by_socket.clear()
+        self.by_username.clear()
+
+    def stats(self):
+        """
+        Connection counts and the approximate memory each connection costs:
+        its session object, the containers it owns and its share of the indexes.
+        Strings and sockets are shared with the rest of the app and not counted.
+        """
+        total = sys.getsizeof(self.by_socket) + sys.getsizeof(self.by_username)
+        for sessions in self.by_username.values():
+            total += sys.getsizeof(sessions)
+        for session in self.by_socket.values():
+            total += sys.getsizeof(session)
+            for cls in type(session).__mro__[:-1]:
+                for name in cls.__slots__:
+                    value = getattr(session, name)
+                    if isinstance(value, (set, dict, list, LocationTrail)):
+                        total += sys.getsizeof(value)
+        return {
+            "connections": len(self.by_socket),
+            "users": len(self.by_username),
+            "bytes_per_connection": round(total / len(self.by_socket)) if self.by_socket else 0
+        }
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from .auth import verify_token_payload
+from .login import create_access_token
+
+TOKEN_REFRESH_BEFORE = 300  # seconds before expiry the server pushes a fresh token
+
+
+def socket_identity(token: str):
+    """
+    Verify the token from a WebSocket auth frame.
+    Guests are identified by their Guest name and never expire.
+    Returns (username, expires_at, user_type).
+    """
+    if token[:5] == 'Guest':
+        return token, None, None
+    payload = verify_token_payload(token)
+    return payload["sub"], payload.get("exp"), payload.get("user_type")
+
+
+def session_is_current(session):
+    """
+    Cheap per-message check that replaces decoding the JWT again.
+    """
+    return session.expires_at is None or time.time() < session.expires_at
+
+
+def send_control(session, message):
+    """
+    Queue an auth frame in the session's outbox, in order with what is
+    already waiting and never dropped. Returns False if the client was evicted.
+    """
+    return session.outbox.put(json.dumps(message), keep=True)
+
+
+def reauthenticate(session, token: str):
+    """
+    Handle an {"type": "auth"} frame on an open socket, e.g. after the client
+    logged in again. The token has to belong to the same user.
+    Returns True if the session was renewed.
+    """
+    try:
+        username, expires_at, user_type = socket_identity(token)
+    except Exception:
+        username = None
+    if username != session.username:
+        send_control(session, {"type": "auth_error", "detail": "Invalid token"})
+        return False
+    session.expires_at = expires_at
+    session.user_type = user_type
+    schedule_token_refresh(session)
+    return True
+
+
+def reject_expired(session):
+    send_control(session, {"type": "auth_required", "detail": "Token expired"})
+
+
+def schedule_token_refresh(session):
+    """
+    Push a fresh token TOKEN_REFRESH_BEFORE seconds before the session's
+    token runs out, so an open socket never has to re-authenticate.
+    """
+    cancel_token_refresh(session)
+    if session.expires_at is None:
+        return
+    delay = max(0, session.expires_at - TOKEN_REFRESH_BEFORE - time.time())
+    session.refresh_handle = asyncio.get_running_loop().call_later(delay, refresh_session_token, session)
+
+
+def cancel_token_refresh(session):
+    if session.refresh_handle is not None:
+        session.refresh_handle.cancel()
+        session.refresh_handle = None
+
+
+def refresh_session_token(session):
+    session.refresh_handle = None
+    token = create_access_token(data={"sub": session.username, "user_type": session.user_type or "user"})
+    expires_at = verify_token_payload(token)["exp"]
+    if not send_control(session, {
+        "type": "token_refresh",
+        "token": token,
+        "expiry": datetime.utcfromtimestamp(expires_at).isoformat() + "Z"
+    }):
+        # the client was evicted, its own cleanup will run
+        return
+    session.expires_at = expires_at
+    schedule_token_refresh(session)
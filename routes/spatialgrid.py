@@ -0,0 +1,229 @@
+from math import cos, radians, floor
+from .calculatedistance import calculate_distance
+
+METERS_PER_DEGREE = 111320  # length of one degree of latitude
+HALF_RADIAN = radians(0.5)  # turns a sum of two latitudes into the radians of their mean
+
+
+def within_radius(lat, lng, other_lat, other_lng, radius_m):
+    """
+    Equirectangular distance check, good to a few metres at area-of-interest
+    distances and far cheaper than the haversine. The longitude is scaled at
+    the mean latitude, so the answer is the same whichever point comes first.
+    """
+    dlat = other_lat - lat
+    dlng = (other_lng - lng) * cos((lat + other_lat) * HALF_RADIAN)
+    limit = radius_m / METERS_PER_DEGREE
+    return dlat * dlat + dlng * dlng <= limit * limit
+
+
+class SpatialGrid:
+    """
+    Uniform lat/lng grid that buckets items by the cell they fall in.
+    A radius or bounding box query only visits the cells that overlap it
+    instead of scanning every item.
+    """
+
+    def __init__(self, cell_size_deg=0.05):
+        self.cell_size = cell_size_deg
+        self.cells = {}  # (row, col) -> {key: (lat, lng, item)}
+        self.items = {}  # key -> (lat, lng, item), the same tuples as in cells
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def _cell(self, lat, lng):
+        return (floor(lat / self.cell_size), floor(lng / self.cell_size))
+
+    def add(self, key, lat, lng, item):
+        # re-adding a key moves it to its new cell
+        self.remove(key)
+        entry = self.items[key] = (lat, lng, item)
+        self.cells.setdefault(self._cell(lat, lng), {})[key] = entry
+
+    def remove(self, key):
+        entry = self.items.pop(key, None)
+        if entry is None:
+            return None
+        lat, lng, item = entry
+        cell_key = self._cell(lat, lng)
+        cell = self.cells.get(cell_key)
+        if cell is not None:
+            cell.pop(key, None)
+            if not cell:
+                del self.cells[cell_key]
+        return item
+
+    def get(self, key):
+        entry = self.items.get(key)
+        return entry[2] if entry else None
+
+    def values(self):
+        return [entry[2] for entry in self.items.values()]
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+
+    def copy(self):
+        """
+        A snapshot to query while this grid keeps changing; the items themselves are shared.
+        """
+        grid = SpatialGrid(self.cell_size)
+        grid.items = dict(self.items)
+        grid.cells = {cell_key: dict(cell) for cell_key, cell in self.cells.items()}
+        return grid
+
+    def query_bbox(self, south, west, north, east):
+        """
+        Return the items whose position lies inside the bounding box.
+        """
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+        found = []
+        # sparse grids are cheaper to walk cell by cell from the occupied side
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            cell_keys = [c for c in self.cells if min_row <= c[0] <= max_row and min_col <= c[1] <= max_col]
+        else:
+            cell_keys = [(r, c) for r in range(min_row, max_row + 1) for c in range(min_col, max_col + 1)]
+        for cell_key in cell_keys:
+            cell = self.cells.get(cell_key)
+            if not cell:
+                continue
+            for lat, lng, item in cell.values():
+                if south <= lat <= north and west <= lng <= east:
+                    found.append(item)
+        return found
+
+    def cell_window(self, lat, lng, radius_m):
+        """
+        The (min_row, min_col, max_row, max_col) cells a radius query around the point visits.
+        """
+        dlat = radius_m / METERS_PER_DEGREE
+        # widened for the latitude furthest from the equator, which within_radius may scale by
+        dlng = radius_m / (METERS_PER_DEGREE * max(cos(radians(abs(lat) + dlat)), 0.01))
+        return self._cell(lat - dlat, lng - dlng) + self._cell(lat + dlat, lng + dlng)
+
+    def split_radius(self, lat, lng, radius_m):
+        """
+        Visit the cells of cell_window once and return (near, far): the items
+        within radius_m of the point by within_radius, and the rest of those cells.
+        """
+        min_row, min_col, max_row, max_col = self.cell_window(lat, lng, radius_m)
+        limit = radius_m / METERS_PER_DEGREE
+        limit *= limit
+        near = []
+        far = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                cell = self.cells.get((row, col))
+                if not cell:
+                    continue
+                for item_lat, item_lng, item in cell.values():
+                    # within_radius, inlined as this runs for every candidate;
+                    # many of the far ones are already out on latitude alone
+                    dlat = item_lat - lat
+                    dlat *= dlat
+                    if dlat <= limit:
+                        dlng = (item_lng - lng) * cos((lat + item_lat) * HALF_RADIAN)
+                        if dlat + dlng * dlng <= limit:
+                            near.append(item)
+                            continue
+                    far.append(item)
+        return near, far
+
+    def query_radius(self, lat, lng, radius_m):
+        """
+        Return (item, distance in meters) pairs within radius_m of the point.
+        """
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = radius_m / (METERS_PER_DEGREE * max(cos(radians(lat)), 0.01))
+        min_row, min_col = self._cell(lat - dlat, lng - dlng)
+        max_row, max_col = self._cell(lat + dlat, lng + dlng)
+        found = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                cell = self.cells.get((row, col))
+                if not cell:
+                    continue
+                for item_lat, item_lng, item in cell.values():
+                    distance = calculate_distance(lat, lng, item_lat, item_lng)
+                    if distance <= radius_m:
+                        found.append((item, distance))
+        return found
+
+
+class ViewportIndex:
+    """
+    Index of bounding boxes (map viewports) that answers "which boxes contain
+    this point" by looking at the single grid cell the point falls in.
+    Boxes covering more than max_cells cells are kept in a short list that is
+    always checked, so zoomed-out clients do not flood the grid.
+    """
+
+    def __init__(self, cell_size_deg=0.25, max_cells=64):
+        self.cell_size = cell_size_deg
+        self.max_cells = max_cells
+        self.cells = {}  # (row, col) -> set of keys
+        self.wide = set()
+        self.boxes = {}  # key -> (south, west, north, east, item)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        return key in self.boxes
+
+    def _cell_range(self, south, west, north, east):
+        return (
+            floor(south / self.cell_size), floor(west / self.cell_size),
+            floor(north / self.cell_size), floor(east / self.cell_size),
+        )
+
+    def set(self, key, south, west, north, east, item):
+        self.remove(key)
+        self.boxes[key] = (south, west, north, east, item)
+        min_row, min_col, max_row, max_col = self._cell_range(south, west, north, east)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > self.max_cells:
+            self.wide.add(key)
+            return
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                self.cells.setdefault((row, col), set()).add(key)
+
+    def remove(self, key):
+        box = self.boxes.pop(key, None)
+        if box is None:
+            return None
+        if key in self.wide:
+            self.wide.discard(key)
+            return box[4]
+        min_row, min_col, max_row, max_col = self._cell_range(*box[:4])
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                keys = self.cells.get((row, col))
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.cells[(row, col)]
+        return box[4]
+
+    def get(self, key):
+        box = self.boxes.get(key)
+        return box[4] if box else None
+
+    def query_point(self, lat, lng):
+        """
+        Return (key, item) for every box containing the point.
+        """
+        found = []
+        candidates = self.cells.get((floor(lat / self.cell_size), floor(lng / self.cell_size)), ())
+        for keys in (candidates, self.wide):
+            for key in keys:
+                south, west, north, east, item = self.boxes[key]
+                if south <= lat <= north and west <= lng <= east:
+                    found.append((key, item))
+        return found
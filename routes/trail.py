@@ -0,0 +1,65 @@
+import sys
+from array import array
+
+
+class LocationTrail:
+    """
+    Fixed-size ring buffer of timestamped positions, kept in flat typed
+    arrays instead of a Python object per point. Once full, the oldest point
+    is overwritten, so memory stays the same however long the user drives:
+    16 bytes a point (a double timestamp and float32 lat/lng, the precision
+    the binary location frames use too).
+    """
+    __slots__ = ("capacity", "times", "lats", "lngs", "next", "count")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.lats = array("f", bytes(4 * capacity))
+        self.lngs = array("f", bytes(4 * capacity))
+        self.next = 0  # slot the next point is written to
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + sys.getsizeof(self.times)
+                + sys.getsizeof(self.lats) + sys.getsizeof(self.lngs))
+
+    def append(self, timestamp, lat, lng):
+        i = self.next
+        self.times[i] = timestamp
+        self.lats[i] = lat
+        self.lngs[i] = lng
+        self.next = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest_time(self):
+        return self.times[self.next - 1] if self.count else None
+
+    def points(self, since=0.0):
+        """
+        (timestamp, lat, lng) tuples recorded at or after `since`, oldest first.
+        """
+        start = (self.next - self.count) % self.capacity
+        result = []
+        for k in range(self.count):
+            i = (start + k) % self.capacity
+            if self.times[i] >= since:
+                result.append((self.times[i], self.lats[i], self.lngs[i]))
+        return result
+
+    def downsample(self, since=0.0, max_points=100):
+        """
+        At most `max_points` evenly spaced points since `since`, always
+        including the first and the latest.
+        """
+        points = self.points(since)
+        if len(points) <= max_points:
+            return points
+        if max_points < 2:
+            return points[-max_points:] if max_points else []
+        last = len(points) - 1
+        return [points[round(k * last / (max_points - 1))] for k in range(max_points)]
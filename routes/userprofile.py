@@ -7,7 +7,7 @@ from pathlib import Path
 from uuid import uuid4
 from pymongo.errors import DuplicateKeyError
 from .login import create_access_token
-from .location import location_users
+from .location import location_users, location_dirty
 from PIL import Image, ImageDraw, ImageOps
 from io import BytesIO
 from datetime import datetime
@@ -216,9 +216,9 @@ async def upload_avatar(token: str, file: UploadFile = File(...), request: Reque
     # Persist the URL in the user record
     await user_collection.update_one({"username": username}, {"$set": {"profilePicture": url}})
 
-    for user in location_users:
-        if user[0] == username:
-            user[2] = url
+    for session in location_users.sessions_for(username):
+        session.icon = url
+        location_dirty.add(session.websocket)  # peers get the new avatar on the next tick
 
     return {"url": url}
 
@@ -0,0 +1,117 @@
+class WordFilter:
+    """
+    Aho-Corasick automaton over a word list, so masking a message costs one
+    pass over its characters however many words are listed.
+
+    Matches exactly what the regex r'\\b(?:w1|w2|...)\\b' with IGNORECASE
+    would replace: a word only counts between word boundaries, scanning goes
+    left to right without overlaps, and where several words fit at the same
+    position the one listed first wins.
+    """
+
+    def __init__(self, words):
+        self.words = [word for word in dict.fromkeys(words) if word]
+        self.goto = [{}]  # node -> {char: node}
+        self.fail = [0]
+        # node -> ((length, priority), ...) for every word ending at that node, fail links included
+        self.outputs = [()]
+        for priority, word in enumerate(self.words):
+            node = 0
+            for char in fold(word):
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                node = next_node
+            self.outputs[node] += ((len(word), priority),)
+        self._link()
+
+    def __len__(self):
+        return len(self.words)
+
+    def _link(self):
+        # breadth first, so a node's fail target is finished before the node itself
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                target = self.fail[node]
+                while target and char not in self.goto[target]:
+                    target = self.fail[target]
+                self.fail[child] = self.goto[target].get(char, 0)
+                self.outputs[child] += self.outputs[self.fail[child]]
+
+    def matches(self, text):
+        """
+        (start, end) spans to mask, in order.
+        """
+        if not self.words:
+            return []
+        folded = fold(text)
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        best = {}  # start -> (priority, end) of the preferred word starting there
+        node = 0
+        for i, char in enumerate(folded):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not outputs[node]:
+                continue
+            end = i + 1
+            if not at_boundary(text, end):
+                continue
+            for length, priority in outputs[node]:
+                start = end - length
+                if at_boundary(text, start) and (start not in best or priority < best[start][0]):
+                    best[start] = (priority, end)
+
+        spans = []
+        last_end = 0
+        for start in sorted(best):
+            if start >= last_end:
+                last_end = best[start][1]
+                spans.append((start, last_end))
+        return spans
+
+    def mask(self, text):
+        """
+        Replace every listed word in the text with asterisks of the same length.
+        """
+        spans = self.matches(text)
+        if not spans:
+            return text
+        parts = []
+        last_end = 0
+        for start, end in spans:
+            parts.append(text[last_end:start])
+            parts.append("*" * (end - start))
+            last_end = end
+        parts.append(text[last_end:])
+        return "".join(parts)
+
+
+def fold(text):
+    """
+    Lowercase without changing the length, so positions in the folded text
+    are positions in the original.
+    """
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+def is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+def at_boundary(text, i):
+    """
+    Whether \\b matches at position i.
+    """
+    before = i > 0 and is_word_char(text[i - 1])
+    after = i < len(text) and is_word_char(text[i])
+    return before != after
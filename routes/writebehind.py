@@ -0,0 +1,202 @@
+import asyncio
+import time
+import bson
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo.errors import (
+    BulkWriteError, ConnectionFailure, DocumentTooLarge, DuplicateKeyError, ExecutionTimeout,
+    OperationFailure, WTimeoutError
+)
+
+DUPLICATE_KEY = 11000
+MAX_DOCUMENT_BYTES = 16 * 1024 * 1024  # MongoDB's limit on a single document
+TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError)
+
+
+class WriteBufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    """
+    Collects documents in memory and writes them with insert_many, once
+    batch_size are waiting or every `interval` seconds, so writes cost one
+    round trip per batch instead of one per document.
+
+    Documents get their _id when queued and stay queued until a write
+    succeeds; a batch retried after a transient failure or an interrupted
+    write only hits duplicate key errors for what already landed, which are
+    ignored. Documents the database refuses for good are logged and set
+    aside instead, so one bad document cannot hold up the rest.
+    At most max_pending documents wait, beyond that add() raises WriteBufferFull.
+    """
+
+    def __init__(self, collection, batch_size=100, interval=0.1, max_pending=10000, retry_delay=1.0,
+                 max_document_bytes=MAX_DOCUMENT_BYTES):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.max_document_bytes = max_document_bytes
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.lock = asyncio.Lock()  # one insert_many at a time, so batches land in order
+        self.task = None
+        self.closing = False
+        # metrics
+        self.written = 0
+        self.rejected = 0
+        self.set_aside = 0  # documents dropped because they can never be written
+        self.failed_flushes = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.flush_seconds = 0.0
+        self.slowest_flush = 0.0
+        self.last_flush = 0.0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def add(self, document):
+        """
+        Queue a document. Raises WriteBufferFull when the queue is full, and
+        InvalidDocument (DocumentTooLarge when oversized) for a document that could never be written.
+        """
+        if self.closing:
+            raise WriteBufferFull("Shutting down, not accepting writes")
+        if len(self.pending) >= self.max_pending:
+            self.rejected += 1
+            raise WriteBufferFull(f"{len(self.pending)} writes already waiting")
+        document.setdefault("_id", ObjectId())
+        size = len(bson.encode(document))
+        if size > self.max_document_bytes:
+            raise DocumentTooLarge(f"Document of {size} bytes, at most {self.max_document_bytes} are allowed")
+        self.pending.append(document)
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    async def run(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not await self.flush():
+                await asyncio.sleep(self.retry_delay)
+
+    async def flush(self):
+        """
+        Write everything queued so far, batch by batch. Returns False if a
+        write failed with a transient error and the batch has to be retried.
+        """
+        async with self.lock:
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                started = time.perf_counter()
+                refused, error = await self.write(batch)
+                if refused:
+                    self.set_aside += len(refused)
+                    for document, reason in refused:
+                        print(f"Dropping chat message {document['_id']} that cannot be written: {reason}")
+                if error is not None:
+                    refused_ids = {id(document) for document, _ in refused}
+                    self.pending[:len(batch)] = [document for document in batch if id(document) not in refused_ids]
+                    self.failed_flushes += 1
+                    print(f"Error writing {len(batch)} chat messages, retrying: {error}")
+                    return False
+                elapsed = time.perf_counter() - started
+                del self.pending[:len(batch)]
+                self.written += len(batch) - len(refused)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self.flush_seconds += elapsed
+                self.slowest_flush = max(self.slowest_flush, elapsed)
+                self.last_flush = elapsed
+            return True
+
+    async def write(self, batch):
+        """
+        insert_many one batch. Returns the (document, reason) pairs the
+        database refused for good, and the transient error to retry on, if any.
+        """
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # unordered, so everything without a write error landed
+            refused = [
+                (batch[error["index"]], error.get("errmsg", error["code"]))
+                for error in e.details.get("writeErrors", ()) if error["code"] != DUPLICATE_KEY
+            ]
+            concern_errors = e.details.get("writeConcernErrors")
+            return refused, (repr(concern_errors) if concern_errors else None)
+        except InvalidDocument:
+            # raised while encoding, before knowing which document is at fault
+            return await self.write_one_by_one(batch)
+        except Exception as e:
+            if is_transient(e):
+                return [], repr(e)
+            return [(document, repr(e)) for document in batch], None
+        return [], None
+
+    async def write_one_by_one(self, batch):
+        refused = []
+        for document in batch:
+            try:
+                await self.collection.insert_one(document)
+            except DuplicateKeyError:
+                pass
+            except Exception as e:
+                if is_transient(e):
+                    return refused, repr(e)
+                refused.append((document, repr(e)))
+        return refused, None
+
+    async def close(self, attempts=3):
+        """
+        Stop taking writes and flush what is left, retrying a few times
+        before giving up on it. Called on shutdown.
+        """
+        self.closing = True
+        self.wakeup.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+        for attempt in range(attempts):
+            if await self.flush():
+                return True
+            await asyncio.sleep(self.retry_delay)
+        print(f"Lost {len(self.pending)} chat messages that could not be written on shutdown")
+        return False
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "rejected": self.rejected,
+            "set_aside": self.set_aside,
+            "failed_flushes": self.failed_flushes,
+            "batches": self.batches,
+            "average_batch_size": round(self.written / self.batches, 1) if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "average_flush_ms": round(self.flush_seconds * 1000 / self.batches, 2) if self.batches else 0,
+            "slowest_flush_ms": round(self.slowest_flush * 1000, 2),
+            "last_flush_ms": round(self.last_flush * 1000, 2)
+        }
+
+
+def is_transient(error):
+    """
+    Whether a failed write is worth retrying as is. Documents that cannot be
+    encoded and commands the server rejects, other than timeouts and
+    retryable errors, would fail the same way again.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, OperationFailure):
+        return error.has_error_label("RetryableWriteError")
+    return not isinstance(error, InvalidDocument)